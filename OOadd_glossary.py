@@ -15,10 +15,11 @@
 import argparse
 import fileinput
 import os
-import re
 import sys
 import time
 import warnings
+import OOglossary
+from multiprocessing import Pool
 if not sys.warnoptions:
     warnings.simplefilter("ignore")
 parser = argparse.ArgumentParser(description='Add glossary references in html files prepared by OOsplit.py so the appropriate texts will have active PB glossary terms. Text which consists of a non-letter character followed by a term from the glossary_manifest in any case, followed by a non-letter chacter is considered "appropriate" (only the term itself is activated, not the surrounding non-letter characters).')
@@ -30,6 +31,8 @@ parser.add_argument('-a', '--activationless', help="do not activate glossary ter
 parser.add_argument('-s', '--start_from', help="skip all lines of the manifest up through the first one whose content title contains the given string", default='')
 parser.add_argument('-u', '--updating_manifest', help='filename of new manifest which can be used with OOreup.py to activate the glossary terms in the PB book; dafault is "manifest.add_glossary"', default='manifest.add_glossary')
 parser.add_argument('-b', '--backup_changed_files', help='save a backup copy of the original file, in a file with the same name to which "~" is appended', action='store_true')
+parser.add_argument('--no_glossary_index', help='do not use or write the index (in a file named as the manifest with ".glossary.json" appended) of where terms were activated, with which files unchanged since the last run are skipped unless they have terms new to the glossary in them', action='store_true')
+parser.add_argument("-j", "--jobs", help="how many files to process at once in separate processes; default is the number of CPUs", type=int, default=os.cpu_count() or 1)
 args = parser.parse_args()
 verbose = args.verbose
 start_from = args.start_from
@@ -73,78 +76,69 @@ while True:
     continue
   if mline[:6]!="Part: ":
     raise ValueError(f'Malformed manfiest file: unrecognized line "{mline}"')
-refs_pat = re.compile("<h1>[1-9][0-9]?.[1-9][0-9]?.[1-9][0-9]? References</h1>")
-LandA_pat = re.compile("<h1>[1-9][0-9]?.[1-9][0-9]?.[1-9][0-9]? Licenses and Attributions")
-img_desc_pat = re.compile(r'<a id="fig[1-9][0-9]?.[1-9][0-9]?"></a><strong>Image Description')
-header_pat = re.compile(r'<h[1-5]>')
+#
+# the glossary terms, all found at once in each line by one matcher (see
+#   OOglossary.py); no term may appear inside another
+#
 terms = []
 term_ids = {}
-term_pats = {}
 term_fixes = {}
-while True:
-  gline = readcl(args.glossary_manifest)
-  if not gline:
-    break
-  gfn = readcl(args.glossary_manifest)
-  if not gfn:
-    raise ValueError(f"Malformed glossary manifest file: no filename for content line {gline}")
-  t = gline[gline.find(":")+1:].strip()
+for (id, t, gfn) in OOglossary.read_glossary_manifest(args.glossary_manifest):
   terms.append(t)
-  id = gline[3:gline.find("]")]
   term_ids[t] = id
-  pat = re.compile("("+t+")", re.IGNORECASE)
-  term_pats[t] = pat
   term_fixes[t] = 0
-for i in range(len(terms)):
-  for j in range(len(terms)):
-    if i==j:
-      continue
-    if term_pats[terms[i]].search(terms[j]):
-      raise ValueError(f"Bad glossary: {terms[i]} conflicts with {terms[j]}")
+conflicts = [f"{terms[i]} conflicts with {terms[j]}" for (i, j) in OOglossary.conflicts(terms)]
+if conflicts:
+  for c in conflicts:
+    log_and_print("Bad glossary: "+c)
+  raise ValueError(f"Bad glossary, with {len(conflicts)} conflicts (check it with OOcheck_glossary.py):\n"+"\n".join(conflicts))
+#
+# the index from the last run (see OOglossary.py), if any: a file which is
+#   just as that run left it needs doing again only if it has terms new since
+#   then
+#
+index_fn = args.manifest.name+OOglossary.index_suffix
+index = OOglossary.empty_index() if args.no_glossary_index else OOglossary.load_occurrence_index(index_fn)
+known = index["files"] if index["activationless"] == args.activationless else {}
+new_terms = [t for t in terms if index["terms"].get(t) != term_ids[t]]
+#
+# activate the terms in each file, several at once with --jobs, but note the
+#   files in the updating manifest in manifest order
+#
+jobs = [(fn, args.activationless, args.backup_changed_files, known.get(fn, {}).get("sha256")) for fn in files2fix]
+if args.jobs > 1 and len(jobs) > 1:
+  with Pool(min(args.jobs, len(jobs)), OOglossary.init_worker, (terms, term_ids, new_terms)) as pool:
+    results = pool.map(OOglossary.activate_file, jobs)
+else:
+  OOglossary.init_worker(terms, term_ids, new_terms)
+  results = [OOglossary.activate_file(job) for job in jobs]
 total_fixes = 0
 files_with_fixes = 0
-for fn in files2fix:
-  fixes_this_file = 0
-  new_fh = open(fn,"r+")
-  old_contents = new_fh.read()
-  new_contents = ""
-  new_fh.seek(0)
-  no_gloss = False
-  l = ""
-  while True:
-    new_contents += l
-    l = new_fh.readline()
-    if not l:
-      break
-    if no_gloss:
-      if img_desc_pat.match(l) or (l[:4]=="<h1>" and not (refs_pat.match(l) or LandA_pat.match(l))):
-        no_gloss = False
-      continue
-    if refs_pat.match(l) or LandA_pat.match(l):
-      no_gloss = True
-      continue
-    if args.headless and header_pat.match(l):
-      continue
-    for t in terms:
-      [l, n] = term_pats[t].subn(r'[pb_glossary id="'+term_ids[t]+r'"]\1[/pb_glossary]',l)
-      term_fixes[t] += n
-      fixes_this_file += n
+files_skipped = 0
+for (fn, (fixes_this_file, counts, entry)) in zip(files2fix, results):
+  if entry is None:
+    files_skipped += 1
+  else:
+    index["files"][fn] = entry
+  for (t, n) in counts.items():
+    term_fixes[t] += n
   if fixes_this_file:
     if not update_fh:
       update_fh = open(args.updating_manifest,"w")
       update_fh.write("# "+when_work+", this was\n")
       update_fh.write("# "+what_work+" which resulted in this file\n")
     update_fh.write(file_mls[fn])
-    if args.backup_changed_files:
-      old_fh = open(fn+"~","w")
-      old_fh.write(old_contents)
-      old_fh.close()
     total_fixes += fixes_this_file
     files_with_fixes += 1
-    new_fh.seek(0)
-    new_fh.write(new_contents)
-    new_fh.truncate()
-    new_fh.close()
+if files_skipped:
+  log_and_print(f'Skipped {files_skipped} files which had not changed since the last run (see {index_fn})')
+if not args.no_glossary_index:
+  index["terms"] = term_ids
+  index["activationless"] = args.activationless
+  try:
+    OOglossary.save_occurrence_index(index_fn, index)
+  except OSError:
+    log_and_print(f'Could not write the glossary index {index_fn}')
 if total_fixes:
   log_and_print(f'Activated {total_fixes} glossary terms in {files_with_fixes} files (out of {len(files2fix)} files examined)')
   for t in terms:
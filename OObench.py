@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 Jonathan A. Poritz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+import argparse
+import collections
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+import bs4
+import OOclean
+import OOcss
+import OOgen_book
+import OOglossary
+import OOsoup
+if not sys.warnoptions:
+    warnings.simplefilter("ignore")
+#
+# setting up arguments
+#
+parser = argparse.ArgumentParser(description='Benchmarks pieces of the GD -> PB pipeline.')
+subparsers = parser.add_subparsers(dest="benchmark", required=True)
+parsers_parser = subparsers.add_parser("parsers", help='time parsing (plus OOprep cleanup) of a GD html file such as "book.html" with each installed Beautiful Soup parser, reporting peak memory use and any differences in the cleaned HTML')
+parsers_parser.add_argument("input_file", help="GD html file to parse")
+parsers_parser.add_argument("-r", "--runs", help="number of times to time each parser; default is 3", type=int, default=3)
+parsers_parser.add_argument("-b", "--blockquote", help="GD classes which identify a blockquote, as for OOprep", default="")
+parsers_parser.add_argument("-o", "--output", help="file to which the report is also written; default is only to print it", default="")
+parsers_parser.add_argument("-d", "--max_diffs", help="maximum number of differing lines to list per parser; default is 20", type=int, default=20)
+normalizers_parser = subparsers.add_parser("normalizers", help='time each available OOprep normalizer (PyTidyLib, lxml) plus the line-by-line work after it on a GD html file such as "book.html", and list any differences in their output')
+normalizers_parser.add_argument("input_file", help="GD html file to clean and normalize")
+normalizers_parser.add_argument("-r", "--runs", help="number of times to time each normalizer; default is 3", type=int, default=3)
+normalizers_parser.add_argument("-b", "--blockquote", help="GD classes which identify a blockquote, as for OOprep", default="")
+normalizers_parser.add_argument("-o", "--output", help="file to which the report is also written; default is only to print it", default="")
+normalizers_parser.add_argument("-d", "--max_diffs", help="maximum number of differing lines to list per normalizer; default is 20", type=int, default=20)
+OOsoup.add_parser_argument(normalizers_parser)
+parity_parser = subparsers.add_parser("cleanup_parity", help='check that the single-traversal cleanup OOprep uses gives exactly the same HTML and counts as the old one-pass-per-rule version on a GD html file such as "book.html", and time both')
+parity_parser.add_argument("input_file", help="GD html file to clean")
+parity_parser.add_argument("-b", "--blockquote", help="GD classes which identify a blockquote, as for OOprep", default="")
+parity_parser.add_argument("-o", "--output", help="file to which the report is also written; default is only to print it", default="")
+parity_parser.add_argument("-d", "--max_diffs", help="maximum number of differing lines to list; default is 20", type=int, default=20)
+OOsoup.add_parser_argument(parity_parser)
+suite_parser = subparsers.add_parser("suite", help='time OOprep, OOsplit, OOfig_finder, OOlink_finder and OOadd_glossary end to end on synthetic books of several sizes made by OOgen_book.py, writing the results as JSON')
+suite_parser.add_argument("-s", "--sizes", help="book sizes to use, from OOgen_book.py; default is all of them", nargs="+", choices=list(OOgen_book.book_sizes), default=list(OOgen_book.book_sizes))
+suite_parser.add_argument("-r", "--runs", help="number of times to time each tool on each book; default is 3", type=int, default=3)
+suite_parser.add_argument("-j", "--json", help='file to which the results are written; default is "bench_results.json"', default="bench_results.json")
+suite_parser.add_argument("--baseline", help="results file from an earlier run (say, of an earlier version) to compare these results to", default="")
+suite_parser.add_argument("--normalizer", help="normalizer for OOprep to use; default is OOprep's default", choices=list(OOclean.normalizers), default="")
+suite_parser.add_argument("--seed", help="random seed for OOgen_book.py; default is 0", type=int, default=0)
+suite_parser.add_argument("-k", "--keep", help="directory in which to keep the books and everything the tools write; default is to use a temporary directory and remove it afterwards", default="")
+glossary_parser = subparsers.add_parser("glossary", help='time activating glossary terms in synthetic paragraphs from OOgen_book.py with the matcher OOadd_glossary.py uses, and with one regex per term as it used to, for glossaries of several sizes')
+glossary_parser.add_argument("-t", "--terms", help="glossary sizes to use; default is 100 1000 10000", type=int, nargs="+", default=[100, 1000, 10000])
+glossary_parser.add_argument("-p", "--paragraphs", help="number of paragraphs to activate the terms in; default is 2000", type=int, default=2000)
+glossary_parser.add_argument("--per_term_paragraphs", help="number of those paragraphs on which to time the one regex per term way, which is very slow with many terms, its time being scaled up to all of them; default is 100", type=int, default=100)
+glossary_parser.add_argument("-r", "--runs", help="number of times to time the matcher on each glossary; default is 3", type=int, default=3)
+glossary_parser.add_argument("--seed", help="random seed for OOgen_book.py; default is 0", type=int, default=0)
+glossary_parser.add_argument("-o", "--output", help="file to which the report is also written; default is only to print it", default="")
+one_parser = subparsers.add_parser("parse_one")
+one_parser.add_argument("parser")
+one_parser.add_argument("input_file")
+one_parser.add_argument("blockquote")
+one_parser.add_argument("output")
+args = parser.parse_args()
+#
+# peak resident memory of this process, in MB, where the OS will tell us
+#
+def peak_rss_mb():
+  try:
+    import resource
+  except ImportError:
+    return None
+  r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  if sys.platform == "darwin":
+    return r/(1024*1024)
+  return r/1024
+
+#
+# done in a fresh child process for each parser, so that the peak memory use
+#   is that parser's alone: parse and clean the file, write the cleaned HTML
+#   and print the timings
+#
+if args.benchmark == "parse_one":
+  with open(args.input_file,'r') as in_fh:
+    gd_book = in_fh.read()
+  t0 = time.perf_counter()
+  soup = OOsoup.make_soup(gd_book, args.parser)
+  t1 = time.perf_counter()
+  (em_classes, strong_classes) = OOclean.special_classes(OOcss.index_css(gd_book))
+  OOclean.cleanup(soup, em_classes, strong_classes, args.blockquote)
+  t2 = time.perf_counter()
+  with open(args.output,'w') as out_fh:
+    out_fh.write(str(soup))
+  print(json.dumps({"parse": t1-t0, "cleanup": t2-t1, "peak_rss_mb": peak_rss_mb()}))
+  quit()
+
+report = []
+def report_and_print(s):
+  report.append(s)
+  print(s)
+
+#
+# difflib is far too slow on whole books, so just compare two outputs as
+#   multisets of lines
+#
+def report_differences(name_a, a, name_b, b):
+  if a == b:
+    report_and_print(f'{name_b}: output is byte-identical to that from {name_a}')
+    return
+  a_lines = collections.Counter(a.split("\n"))
+  b_lines = collections.Counter(b.split("\n"))
+  only_a = list((a_lines - b_lines).elements())
+  only_b = list((b_lines - a_lines).elements())
+  report_and_print(f'{name_b}: output differs from that from {name_a}: {len(only_a)} lines only from {name_a}, {len(only_b)} only from {name_b}; the first few of each:')
+  for d in only_a[:args.max_diffs]:
+    report_and_print("  - "+d)
+  for d in only_b[:args.max_diffs]:
+    report_and_print("  + "+d)
+
+if args.benchmark == "parsers":
+  parsers = OOsoup.available_parsers()
+  report_and_print(f'Parser benchmark on {args.input_file} ({os.path.getsize(args.input_file)} bytes), best of {args.runs} runs')
+  report_and_print(f'Installed parsers: {", ".join(parsers)} (default: {OOsoup.default_parser()})')
+  report_and_print(f'{"parser":12} {"parse s":>9} {"cleanup s":>10} {"peak RSS MB":>12}')
+  outputs = {}
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    for p in parsers:
+      out_fn = os.path.join(tmp_dir, p)
+      runs = []
+      for i in range(args.runs):
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), "parse_one", p, args.input_file, args.blockquote, out_fn], capture_output=True, text=True)
+        if child.returncode:
+          raise ValueError(f'parsing with {p} failed:\n{child.stderr}')
+        runs.append(json.loads(child.stdout.strip().split("\n")[-1]))
+      best = min(runs, key=lambda r: r["parse"]+r["cleanup"])
+      rss = max(r["peak_rss_mb"] for r in runs) if runs[0]["peak_rss_mb"] is not None else None
+      report_and_print(f'{p:12} {best["parse"]:9.3f} {best["cleanup"]:10.3f} {("%12.1f" % rss) if rss is not None else "n/a":>12}')
+      with open(out_fn,'r') as out_fh:
+        outputs[p] = out_fh.read()
+  #
+  # html.parser is what the tools used before they had a --parser option, so
+  #   compare the others' cleaned HTML to its
+  #
+  if "html.parser" in outputs:
+    for p in parsers:
+      if p != "html.parser":
+        report_differences("html.parser", outputs["html.parser"].replace(">", ">\n"), p, outputs[p].replace(">", ">\n"))
+
+if args.benchmark == "normalizers":
+  normalizers = OOclean.available_normalizers()
+  with open(args.input_file,'r') as in_fh:
+    gd_book = in_fh.read()
+  soup = OOsoup.make_soup(gd_book, args.parser)
+  (em_classes, strong_classes) = OOclean.special_classes(OOcss.index_css(gd_book))
+  OOclean.cleanup(soup, em_classes, strong_classes, args.blockquote)
+  cleaned = str(soup)
+  report_and_print(f'Normalizer benchmark on {args.input_file} ({os.path.getsize(args.input_file)} bytes, {len(cleaned)} characters after cleanup with {args.parser}), best of {args.runs} runs')
+  report_and_print(f'{"normalizer":12} {"normalize s":>12} {"lines s":>8} {"lines":>7}')
+  outputs = {}
+  for n in normalizers:
+    runs = []
+    for i in range(args.runs):
+      t0 = time.perf_counter()
+      document = OOclean.normalizers[n](cleaned)
+      t1 = time.perf_counter()
+      lines = list(OOclean.body_lines(io.StringIO(document), OOclean.new_post_counts()))
+      t2 = time.perf_counter()
+      runs.append((t1-t0, t2-t1))
+    best = min(runs, key=sum)
+    report_and_print(f'{n:12} {best[0]:12.3f} {best[1]:8.3f} {len(lines):7}')
+    outputs[n] = "".join(lines)
+  for n in normalizers[1:]:
+    report_differences(normalizers[0], outputs[normalizers[0]], n, outputs[n])
+
+#
+# the cleanup as OOprep did it before it was one traversal (see OOclean.py):
+#   one find_all() pass over the whole tree for each rule
+#
+def legacy_cleanup(soup, em_classes, strong_classes, blockquote):
+  counts = OOclean.new_counts()
+  for em_class in em_classes:
+    for x in soup.find_all("span",class_=em_class):
+      if x.parent.name in OOclean.headers:
+        continue
+      counts['emphasises'] += 1
+      x.name = "em"
+      del x['class']
+  for strong_class in strong_classes:
+    for x in soup.find_all("span",class_=strong_class):
+      if x.parent.name in OOclean.headers:
+        continue
+      counts['strongs'] += 1
+      x.name = "strong"
+      del x['class']
+  if blockquote:
+    for x in soup.find_all("p",class_=blockquote):
+      counts['blockquotes'] += 1
+      x.name = "blockquote"
+      del x['class']
+  for x in soup.find_all("a"):
+    if len(x.contents)==1 and isinstance(x.contents[0],bs4.NavigableString) and (OOclean.nbspspat.match(x.contents[0]) or OOclean.spacespat.match(x.contents[0])):
+      x.replace_with(bs4.NavigableString(" "))
+      continue
+    if x.get('href') and "https://www.google.com/url?q=" in x.get('href'):
+      counts['google_redirects'] += 1
+      x['href'] = OOclean.unredirect(x['href'])
+  for x in soup.find_all("td"):
+    del x['id']
+    if x.get('colspan') and x.get('rowspan') and x['colspan']=="1" and x['rowspan']=="1":
+      counts['crspans'] += 1
+      del x['colspan']
+      del x['rowspan']
+  for x in soup.find_all("img"):
+    if x.get('style'):
+      del x['style']
+      counts['imgstyles'] += 1
+  for x in soup.find_all("span"):
+    if not x.contents:
+      counts['empty_spans'] += 1
+      x.decompose()
+  for x in soup.find_all(OOclean.headers):
+    if x.get('id'):
+      del x['id']
+      counts['head_ids'] += 1
+    if not x.contents:
+      counts['empty_heads'] += 1
+      x.decompose()
+  for x in soup.find_all("p"):
+    if x.get('id'):
+      del x['id']
+      counts['para_ids'] += 1
+    if not x.contents:
+      counts['empty_paras'] += 1
+      x.decompose()
+  for x in soup.find_all(text=True):
+    x.replace_with(x.replace("\xa0", ""))
+    counts['nbsp'] += 1
+  for x in soup.find_all(text=True):
+    x.replace_with(x.replace("’", "'"))
+  return counts
+
+if args.benchmark == "cleanup_parity":
+  with open(args.input_file,'r') as in_fh:
+    gd_book = in_fh.read()
+  (em_classes, strong_classes) = OOclean.special_classes(OOcss.index_css(gd_book))
+  results = {}
+  for (name, cleanup) in [("multi-pass", legacy_cleanup), ("single-pass", OOclean.cleanup)]:
+    soup = OOsoup.make_soup(gd_book, args.parser)
+    t0 = time.perf_counter()
+    counts = cleanup(soup, em_classes, strong_classes, args.blockquote)
+    results[name] = (time.perf_counter()-t0, counts, str(soup))
+  report_and_print(f'Cleanup parity on {args.input_file} ({os.path.getsize(args.input_file)} bytes) with {args.parser}: multi-pass {results["multi-pass"][0]:.3f}s, single-pass {results["single-pass"][0]:.3f}s')
+  for k in OOclean.counter_names:
+    if results["multi-pass"][1][k] != results["single-pass"][1][k]:
+      report_and_print(f'counts differ for {k}: {results["multi-pass"][1][k]} multi-pass, {results["single-pass"][1][k]} single-pass')
+  report_differences("multi-pass", results["multi-pass"][2].replace(">", ">\n"), "single-pass", results["single-pass"][2].replace(">", ">\n"))
+  parity = results["multi-pass"][1:] == results["single-pass"][1:]
+
+#
+# each tool is run as the workflow in wf runs it, in a fresh copy of the
+#   generated files for every run, so a run never sees an earlier one's
+#   output.  OOprep works on the GD export, the later tools on the book as it
+#   is after OOprep and the hand fixes (see OOgen_book.py), and
+#   OOadd_glossary on the files OOsplit wrote.  A tool which fails is
+#   recorded as such, along with the tools which need its output
+#
+def suite_steps(sizes, made):
+  prep = ["OOprep", "book.html", "-l", "prep.log"]+(["--normalizer", args.normalizer] if args.normalizer else [])
+  figs = sizes['images']*sizes['sections']
+  return [
+    ("OOprep", prep, None),
+    ("OOsplit", ["OOsplit.py", "prepared_book.html", "-i", "pb_imgs.html", "-o", "OOhtml", "-l", "split.log"], None),
+    ("OOfig_finder", ["OOfig_finder", "prepared_book.html", "-M", str(sizes['chapters']), "-m", str(figs), "-l", "fig_finder.log"], None),
+    ("OOlink_finder", ["OOlink_finder.py", "prepared_book.html", "-l", "link_finder.log"], None),
+    ("OOadd_glossary", ["OOadd_glossary.py", os.path.join("glossary", "glossary_manifest"), "-m", os.path.join("OOhtml", "manifest"), "-l", "add_glossary.log"], "OOsplit"),
+  ]
+
+def run_suite(work_dir):
+  tool_dir = os.path.dirname(os.path.abspath(__file__))
+  results = {"date": time.strftime('%Y-%m-%d %H:%M:%S'), "python": sys.version.split()[0], "platform": platform.platform(), "runs": args.runs, "seed": args.seed, "version": git_version(tool_dir), "books": {}}
+  for size in args.sizes:
+    sizes = OOgen_book.book_sizes[size]
+    book = {"sizes": sizes, "steps": {}}
+    for r in range(args.runs):
+      run_dir = os.path.join(work_dir, f'{size}-{r}')
+      made = OOgen_book.generate(run_dir, sizes, args.seed)
+      book["bytes"] = os.path.getsize(made['book'])
+      book["images"] = made['images']
+      failed = []
+      for (name, command, needs) in suite_steps(sizes, made):
+        step = book["steps"].setdefault(name, {"seconds": [], "error": ""})
+        if needs in failed:
+          failed.append(name)
+          step["error"] = f'skipped because {needs} failed'
+          continue
+        t0 = time.perf_counter()
+        child = subprocess.run([sys.executable, os.path.join(tool_dir, command[0])]+command[1:], cwd=run_dir, capture_output=True, text=True)
+        t1 = time.perf_counter()
+        if child.returncode:
+          failed.append(name)
+          step["error"] = (child.stderr.strip().split("\n") or [""])[-1]
+        else:
+          step["seconds"].append(t1-t0)
+    for step in book["steps"].values():
+      step["best"] = min(step["seconds"]) if step["seconds"] else None
+    results["books"][size] = book
+  return results
+
+#
+# the way OOadd_glossary.py used to activate terms: every term's own regex
+#   run over every line in turn
+#
+def activate_per_term(lines, terms, ids):
+  pats = [(re.compile("("+re.escape(t)+")", re.IGNORECASE), '[pb_glossary id="'+ids[t]+'"]\\1[/pb_glossary]') for t in terms]
+  out = []
+  for l in lines:
+    for (pat, repl) in pats:
+      l = pat.sub(repl, l)
+    out.append(l)
+  return out
+
+if args.benchmark == "glossary":
+  report_and_print(f'Glossary benchmark on {args.paragraphs} paragraphs, best of {args.runs} runs (one regex per term timed on {min(args.per_term_paragraphs, args.paragraphs)} paragraphs, once, and scaled up)')
+  report_and_print(f'{"terms":>6} {"build s":>8} {"matcher s":>10} {"per term s":>11} {"speedup":>8} {"activated":>10}  same output')
+  for n in args.terms:
+    writer = OOgen_book.BookWriter(dict(OOgen_book.book_sizes['small'], terms=n), args.seed)
+    lines = [writer.paragraph(1, 1, i)[1][0] for i in range(args.paragraphs)]
+    terms = writer.terms
+    ids = {t: str(1000+i) for (i, t) in enumerate(terms)}
+    t0 = time.perf_counter()
+    matcher = OOglossary.GlossaryMatcher(terms, ids)
+    build = time.perf_counter()-t0
+    runs = []
+    for r in range(args.runs):
+      counts = collections.Counter()
+      t0 = time.perf_counter()
+      activated = [matcher.activate(l, counts)[0] for l in lines]
+      runs.append(time.perf_counter()-t0)
+    sample = lines[:args.per_term_paragraphs]
+    t0 = time.perf_counter()
+    per_term = activate_per_term(sample, terms, ids)
+    per_term_s = (time.perf_counter()-t0)*len(lines)/len(sample)
+    same = "yes" if per_term == activated[:len(sample)] else "NO"
+    report_and_print(f'{len(terms):6} {build:8.3f} {min(runs):10.3f} {per_term_s:11.3f} {per_term_s/min(runs):8.1f} {sum(counts.values()):10}  {same}')
+
+def git_version(dir):
+  try:
+    return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=dir, capture_output=True, text=True).stdout.strip()
+  except OSError:
+    return ""
+
+if args.benchmark == "suite":
+  if args.keep:
+    os.makedirs(args.keep, exist_ok=True)
+    results = run_suite(args.keep)
+  else:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      results = run_suite(tmp_dir)
+  baseline = {}
+  if args.baseline:
+    with open(args.baseline,'r') as baseline_fh:
+      baseline = json.load(baseline_fh)
+  report_and_print(f'Suite benchmark, version {results["version"] or "unknown"}, best of {args.runs} runs'+(f', compared to {args.baseline} (version {baseline.get("version") or "unknown"})' if baseline else ""))
+  report_and_print(f'{"book":8} {"bytes":>10} {"tool":15} {"best s":>9}'+(f' {"baseline s":>11} {"ratio":>7}' if baseline else ""))
+  for (size, book) in results["books"].items():
+    for (name, step) in book["steps"].items():
+      line = f'{size:8} {book["bytes"]:10} {name:15} '+(f'{step["best"]:9.3f}' if step["best"] is not None else f'{"failed":>9}')
+      old = baseline.get("books", {}).get(size, {}).get("steps", {}).get(name, {}).get("best") if baseline else None
+      if old and step["best"] is not None:
+        line += f' {old:11.3f} {step["best"]/old:7.2f}'
+      if step["error"]:
+        line += f'  ({step["error"]})'
+      report_and_print(line)
+  with open(args.json,'w') as json_fh:
+    json.dump(results, json_fh, indent=1)
+  report_and_print(f'Wrote results to {args.json}')
+
+if args.benchmark in ["parsers", "normalizers", "glossary", "cleanup_parity"]:
+  if args.output:
+    with open(args.output,'w') as out_fh:
+      out_fh.write("\n".join(report)+"\n")
+if args.benchmark == "cleanup_parity" and not parity:
+  sys.exit(1)
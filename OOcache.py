@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 Jonathan A. Poritz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# A directory of prepared chapters for OOprep --cache, so that when a book
+#   is re-exported from GD only the chapters which changed are cleaned and
+#   tidied again.  Not meant to be run by itself.
+#
+import hashlib
+import json
+import os
+import time
+import bs4
+#
+# bump this whenever a change to OOclean.py changes what a chapter prepares
+#   to, so old entries are never used
+#
+cache_version = "1"
+entry_suffix = ".json"
+
+#
+# the key for a job as given to OOclean.prep_chapter(): a hash of the raw
+#   chapter HTML and of everything else which affects its output
+#
+def chapter_key(job):
+  (piece, first, parser, em_classes, strong_classes, blockquote, normalizer) = job
+  h = hashlib.sha256()
+  h.update(json.dumps([cache_version, bs4.__version__, first, parser, sorted(em_classes), sorted(strong_classes), blockquote, normalizer]).encode())
+  h.update(piece.encode())
+  return h.hexdigest()
+
+class ChapterCache:
+  def __init__(self, cache_dir):
+    self.cache_dir = cache_dir
+    self.hits = 0
+    self.misses = 0
+    self.evicted = 0
+    os.makedirs(cache_dir, exist_ok=True)
+
+  def path(self, key):
+    return os.path.join(self.cache_dir, key+entry_suffix)
+
+  #
+  # the (lines, counts, post_counts) saved for key, or None.  A hit touches
+  #   the entry, so eviction by size removes the least recently used first
+  #
+  def get(self, key):
+    p = self.path(key)
+    try:
+      with open(p, 'r') as fh:
+        entry = json.load(fh)
+      os.utime(p)
+    except (OSError, ValueError):
+      self.misses += 1
+      return None
+    self.hits += 1
+    return (entry["lines"], entry["counts"], entry["post_counts"])
+
+  #
+  # written to a temporary name and then renamed, so that an interrupted run
+  #   never leaves a half-written entry
+  #
+  def put(self, key, result):
+    (lines, counts, post_counts) = result
+    p = self.path(key)
+    tmp = p+f'.{os.getpid()}.tmp'
+    with open(tmp, 'w') as fh:
+      json.dump({"lines": lines, "counts": counts, "post_counts": post_counts}, fh)
+    os.replace(tmp, p)
+
+  #
+  # remove entries not used in max_age_days, then the least recently used
+  #   ones until the total is at most max_mb
+  #
+  def evict(self, max_age_days, max_mb):
+    now = time.time()
+    entries = []
+    for fn in os.listdir(self.cache_dir):
+      if not fn.endswith(entry_suffix):
+        continue
+      p = os.path.join(self.cache_dir, fn)
+      st = os.stat(p)
+      if now-st.st_mtime > max_age_days*86400:
+        os.remove(p)
+        self.evicted += 1
+      else:
+        entries.append((st.st_mtime, st.st_size, p))
+    total = sum(e[1] for e in entries)
+    for (mtime, size, p) in sorted(entries):
+      if total <= max_mb*1024*1024:
+        break
+      os.remove(p)
+      total -= size
+      self.evicted += 1
+
+  def summary(self):
+    return f'Chapter cache {self.cache_dir}: {self.hits} hits, {self.misses} misses, {self.evicted} entries evicted'
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 Jonathan A. Poritz
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+import argparse
+import sys
+import warnings
+import OOglossary
+if not sys.warnoptions:
+    warnings.simplefilter("ignore")
+parser = argparse.ArgumentParser(description='Checks a glossary manifest, as produced by OOgloss_down.py, before it is used with OOadd_glossary.py: reports every glossary term which appears (in any case) inside another term, since OOadd_glossary.py refuses to work with such a glossary.  Exits with status 1 if there are any.')
+parser.add_argument("glossary_manifest", help="glossary manifest as produced by OOgloss_down.py", type=argparse.FileType('r'))
+args = parser.parse_args()
+terms = [t for (id, t, gfn) in OOglossary.read_glossary_manifest(args.glossary_manifest)]
+conflicts = OOglossary.conflicts(terms)
+for (i, j) in conflicts:
+  print(f"{terms[i]} conflicts with {terms[j]}")
+if conflicts:
+  print(f"Found {len(conflicts)} conflicts among the {len(terms)} glossary terms")
+else:
+  print(f"No conflicts among the {len(terms)} glossary terms")
+sys.exit(1 if conflicts else 0)
@@ -0,0 +1,571 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 Jonathan A. Poritz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# The cleanup used by OOprep: the Beautiful Soup rules, applied in one
+#   traversal of the parse tree, and the tidying and line-by-line work done
+#   afterwards.  Not meant to be run by itself.
+#
+import html
+import html.parser
+import importlib.util
+import io
+import re
+import time
+import urllib.parse
+import bs4
+from tidylib import tidy_document
+import OOcss
+import OOsoup
+#
+# the counters reported by OOprep, in the order they are reported
+#
+counter_names = ['blockquotes', 'strongs', 'emphasises', 'google_redirects', 'crspans', 'imgstyles', 'head_ids', 'para_ids', 'empty_spans', 'empty_heads', 'empty_paras', 'nbsp']
+headers = ['h1', 'h2', 'h3', 'h4', 'h5']
+nbspspat = re.compile(r"(&nbsp;)*$")
+spacespat = re.compile(r"(\xa0)*$")
+#
+# returned by a handler which has removed the element it was given
+#
+REMOVED = object()
+
+def new_counts():
+  return dict.fromkeys(counter_names, 0)
+
+def summary(counts):
+  return f'''Fixed
+{counts['blockquotes']} blockquotes
+{counts['strongs']} strongs
+{counts['emphasises']} emphases
+{counts['google_redirects']} Google redirects
+{counts['crspans']} <td>s with colspan=rowspan="1"
+{counts['imgstyles']} style sections in img tags
+{counts['head_ids']} id sections in header tags
+{counts['para_ids']} id sections in p tags
+{counts['empty_spans']} empty span tags
+{counts['empty_heads']} empty header tags
+{counts['empty_paras']} empty p tags
+{counts['nbsp']} unneeded '&nbsp;'s'''
+
+#
+# the GD classes which should become <em> and <strong>: those which just make
+#   text italic or bold, from the index of the GD stylesheet (see OOcss.py)
+#
+def special_classes(css_index):
+  return (OOcss.em_classes(css_index), OOcss.strong_classes(css_index))
+
+#
+# same test Beautiful Soup applies for find_all(..., class_=c): c is one of
+#   the element's classes, or (if it contains a space) is exactly its whole
+#   class attribute
+#
+def has_class(x, c):
+  classes = x.get('class') or []
+  return c in classes or ' '.join(classes) == c
+
+def has_any_class(x, cs):
+  return any(has_class(x, c) for c in cs)
+
+def unredirect(href):
+  href = urllib.parse.unquote(href.replace("https://www.google.com/url?q=",""))
+  if "&sa" in href:
+    href=href[:href.index("&sa")]
+  if "&amp;sa" in href:
+    href=href[:href.index("&amp;sa")]
+  return href
+
+class Cleaner:
+  #
+  # handlers are registered by tag name, or under "text" for strings; "pre"
+  #   handlers see an element before its children are visited, "post" handlers
+  #   after.  A handler may return REMOVED, or a replacement node which is then
+  #   visited in its place.  Once a handler renames an element, handlers for
+  #   the old name are no longer applied to it.
+  #
+  def __init__(self):
+    self.pre = {}
+    self.post = {}
+    self.text = []
+    self.counts = new_counts()
+
+  def on(self, names, handler, post=False):
+    if isinstance(names, str):
+      names = [names]
+    table = self.post if post else self.pre
+    for n in names:
+      table.setdefault(n, []).append(handler)
+
+  def on_text(self, handler):
+    self.text.append(handler)
+
+  def _dispatch(self, x, table):
+    name = x.name
+    for h in table.get(name, ()):
+      r = h(x)
+      if r is not None:
+        return r
+      if x.name != name:
+        break
+    return None
+
+  def visit(self, x):
+    if isinstance(x, bs4.NavigableString):
+      for h in self.text:
+        r = h(x)
+        if r is not None:
+          x = r
+      return
+    r = self._dispatch(x, self.pre)
+    if r is REMOVED:
+      return
+    if r is not None:
+      self.visit(r)
+      return
+    for child in list(x.contents):
+      self.visit(child)
+    self._dispatch(x, self.post)
+
+  def run(self, soup):
+    for child in list(soup.contents):
+      self.visit(child)
+    return self.counts
+
+#
+# register all of the GD cleanup rules on a Cleaner
+#
+def gd_cleaner(em_classes, strong_classes, blockquote):
+  c = Cleaner()
+  counts = c.counts
+  #
+  # a few special HTML types that GD does with classes
+  #
+  def em(x):
+    if has_any_class(x, em_classes) and x.parent.name not in headers:
+      counts['emphasises'] += 1
+      x.name = "em"
+      del x['class']
+  def strong(x):
+    if has_any_class(x, strong_classes) and x.parent.name not in headers:
+      counts['strongs'] += 1
+      x.name = "strong"
+      del x['class']
+  def bq(x):
+    if has_class(x, blockquote):
+      counts['blockquotes'] += 1
+      x.name = "blockquote"
+      del x['class']
+  if em_classes:
+    c.on("span", em)
+  if strong_classes:
+    c.on("span", strong)
+  if blockquote:
+    c.on("p", bq)
+  #
+  # links whose text is just an &nbsp;, and the annoying redirects Google
+  #   inserts in all links in GDs
+  #
+  def link(x):
+    if len(x.contents)==1 and isinstance(x.contents[0],bs4.NavigableString) and (nbspspat.match(x.contents[0]) or spacespat.match(x.contents[0])):
+      s = bs4.NavigableString(" ")
+      x.replace_with(s)
+      return s
+    if x.get('href') and "https://www.google.com/url?q=" in x.get('href'):
+      counts['google_redirects'] += 1
+      x['href'] = unredirect(x['href'])
+  c.on("a", link)
+  #
+  # weird ways GD handles table cells and img tags
+  #
+  def td(x):
+    del x['id']
+    if x.get('colspan') and x.get('rowspan') and x['colspan']=="1" and x['rowspan']=="1":
+      counts['crspans'] += 1
+      del x['colspan']
+      del x['rowspan']
+  c.on("td", td)
+  def img(x):
+    if x.get('style'):
+      del x['style']
+      counts['imgstyles'] += 1
+  c.on("img", img)
+  #
+  # spurious empty span tag pairs: only spans empty in the original file go,
+  #   so this is checked before the span's children are visited
+  #
+  def span(x):
+    if not x.contents:
+      counts['empty_spans'] += 1
+      x.decompose()
+      return REMOVED
+  c.on("span", span)
+  #
+  # id declarations GD adds to headers and <p>s, and headers and <p>s left
+  #   empty once their empty spans are gone (hence checked after the children).
+  #   As when each of these was a separate pass over the soup, a header is
+  #   checked before the headers and <p>s inside it are removed, and a <p>
+  #   before the <p>s inside it, so one which is only empty for losing those
+  #   is kept
+  #
+  kept = {}
+  def keep_parent(x, outer):
+    if x.parent is not None and x.parent.name in outer:
+      kept[id(x.parent)] = x.parent
+  def head(x):
+    if x.get('id'):
+      del x['id']
+      counts['head_ids'] += 1
+    if not x.contents and id(x) not in kept:
+      counts['empty_heads'] += 1
+      keep_parent(x, headers)
+      x.decompose()
+      return REMOVED
+  c.on(headers, head, post=True)
+  def para(x):
+    if x.get('id'):
+      del x['id']
+      counts['para_ids'] += 1
+    if not x.contents and id(x) not in kept:
+      counts['empty_paras'] += 1
+      keep_parent(x, headers+["p"])
+      x.decompose()
+      return REMOVED
+  c.on("p", para, post=True)
+  #
+  # nbsp and curly apostrophes in every string
+  #
+  def text(x):
+    counts['nbsp'] += 1
+    s = bs4.NavigableString(x.replace("\xa0", "").replace("’", "'"))
+    x.replace_with(s)
+    return s
+  c.on_text(text)
+  return c
+
+def cleanup(soup, em_classes, strong_classes, blockquote):
+  return gd_cleaner(em_classes, strong_classes, blockquote).run(soup)
+
+#
+# normalizers: each takes the cleaned-up HTML as a string and returns it
+#   tidied, as a string with the body's contents one block element per line
+#
+def tidylib_normalize(html_text):
+  document, errors = tidy_document(html_text)
+  return document
+
+#
+# an lxml-based stand-in for tidy: lists, tables and other elements which
+#   contain block elements get their open and close tags on lines of their
+#   own, every other block element is written whole on a single line
+#
+block_tags = ['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ol', 'ul', 'li', 'table', 'thead', 'tbody', 'tfoot', 'tr', 'td', 'th', 'div', 'blockquote', 'dl', 'dt', 'dd', 'hr', 'pre']
+container_tags = ['ol', 'ul', 'table', 'thead', 'tbody', 'tfoot', 'tr', 'dl']
+
+def open_tag(x):
+  return "<"+x.tag+"".join(f' {k}="{html.escape(v)}"' for k, v in x.attrib.items())+">"
+
+def lxml_block_lines(x):
+  import lxml.html
+  if x.text and x.text.strip():
+    yield html.escape(x.text.strip(), quote=False)
+  for y in x:
+    if isinstance(y.tag, str) and (y.tag in container_tags or any(z.tag in block_tags for z in y)):
+      yield open_tag(y)
+      yield from lxml_block_lines(y)
+      yield "</"+y.tag+">"
+    else:
+      yield lxml.html.tostring(y, encoding='unicode', with_tail=False)
+    if y.tail and y.tail.strip():
+      yield html.escape(y.tail.strip(), quote=False)
+
+def lxml_normalize(html_text):
+  import lxml.html
+  doc = lxml.html.document_fromstring(html_text)
+  lines = ["<!DOCTYPE html>", "<html>", "<head>"]
+  head = doc.find('head')
+  if head is not None:
+    lines.extend(lxml.html.tostring(x, encoding='unicode', with_tail=False) for x in head)
+  lines += ["</head>", open_tag(doc.body)]
+  lines.extend(lxml_block_lines(doc.body))
+  lines += ["</body>", "</html>"]
+  return "\n".join(lines)+"\n"
+
+normalizers = {'tidylib': tidylib_normalize, 'lxml': lxml_normalize}
+normalizer_descriptions = {'tidylib': 'PyTidyLib', 'lxml': 'the lxml serializer'}
+
+def available_normalizers():
+  available = []
+  try:
+    tidy_document("")
+    available.append('tidylib')
+  except OSError:
+    pass
+  if importlib.util.find_spec('lxml'):
+    available.append('lxml')
+  return available
+
+#
+# the last cleanup, done line by line on the normalizer's output as it is
+#   written: removal of leftover &nbsp;s, of everything before the <body> and
+#   of the trailing </body></html>; counts what it did in post_counts
+#
+middle_nbsp_pattern=re.compile(r'([a-zA-Z.!?])&nbsp;([a-zA-Z.!?])')
+nbsp_end_p_pattern=re.compile(r' *(&nbsp;)+ *</p>')
+a_nbsp_pattern=re.compile(r'</a> *&nbsp; *')
+nbsp_a_pattern=re.compile(r' *&nbsp; *<a ')
+post_counter_names = ['extra_nbsps', 'preamble_lines', 'body_lines']
+
+def new_post_counts():
+  return dict.fromkeys(post_counter_names, 0)
+
+def body_lines(lines, post_counts):
+  discarding_preamble = True
+  found_end_body = False
+  found_end_html = False
+  for line in lines:
+    if found_end_html:
+      raise ValueError("1: malformed HTML file: tail is something other than just\n  </body>\n  </html>")
+    if found_end_body:
+      if line.strip() != "</html>":
+        raise ValueError("2: malformed HTML file: tail is something other than just\n  </body>\n  </html>")
+      found_end_html = True
+      continue
+    if middle_nbsp_pattern.search(line):
+      post_counts['extra_nbsps'] += 1
+      line=middle_nbsp_pattern.sub(r'\1 \2',line)
+    if nbsp_end_p_pattern.search(line):
+      post_counts['extra_nbsps'] += 1
+      line=nbsp_end_p_pattern.sub(r'</p>',line)
+    if a_nbsp_pattern.search(line):
+      post_counts['extra_nbsps'] += 1
+      line=a_nbsp_pattern.sub(r'</a> ',line)
+    if nbsp_a_pattern.search(line):
+      post_counts['extra_nbsps'] += 1
+      line=nbsp_a_pattern.sub(r' <a ',line)
+    if discarding_preamble and not line.strip().startswith("<body"):
+      post_counts['preamble_lines'] += 1
+      continue
+    discarding_preamble = False
+    if line.strip() == "</body>":
+      found_end_body = True
+      continue
+    post_counts['body_lines'] += 1
+    yield html.unescape(line)
+  if not (found_end_html or found_end_body):
+    raise ValueError("3: malformed HTML file: tail is something other than just\n  </body>\n  </html>")
+
+def post_summary(post_counts, out_fn):
+  return f'''Wrote
+  {str(post_counts['body_lines'])} lines of output to {out_fn}
+after discarding:
+  {str(post_counts['extra_nbsps'])} unneeded '&nbsp;'s
+  {str(post_counts['preamble_lines'])} lines before the first '<h1>Chapter'
+and a trailing
+    </body>
+    </html>'''
+
+#
+# cutting a GD book into chapters, so they can be cleaned and tidied
+#   separately (and in parallel): the book is cut just before each <h1> which
+#   is not inside a list, table, div or blockquote.  The first piece keeps the
+#   whole head of the document and all the pieces keep the trailing
+#   </body></html>; the others get just "<html>" and the original <body> tag
+#
+h1_pat = re.compile(r'<h1[\s>]', re.IGNORECASE)
+body_pat = re.compile(r'<body[^>]*>', re.IGNORECASE)
+nesting_pat = re.compile(r'<(/?)(table|ol|ul|div|blockquote)[\s>]', re.IGNORECASE)
+
+def split_chapters(gd_book):
+  body_match = body_pat.search(gd_book)
+  body_end = gd_book.lower().rfind("</body>")
+  if not body_match or body_end < body_match.end():
+    return [gd_book]
+  body_start = body_match.end()
+  cuts = []
+  depth = 0
+  last = body_start
+  for m in h1_pat.finditer(gd_book, body_start, body_end):
+    for n in nesting_pat.finditer(gd_book, last, m.start()):
+      depth += -1 if n.group(1) else 1
+    last = m.start()
+    if depth == 0 and m.start() > body_start:
+      cuts.append(m.start())
+  tail = gd_book[body_end:]
+  starts = [body_start]+cuts
+  ends = cuts+[body_end]
+  pieces = [gd_book[:body_start]+gd_book[body_start:ends[0]]+tail]
+  for s, e in zip(starts[1:], ends[1:]):
+    pieces.append("<html>"+body_match.group(0)+gd_book[s:e]+tail)
+  return pieces
+
+#
+# clean and tidy one piece from split_chapters(), returning its output lines
+#   and counts.  For all but the first piece, the preamble doesn't count and
+#   the <body> line, which the first piece already has, is dropped
+#
+def prep_chapter(job):
+  (piece, first, parser, em_classes, strong_classes, blockquote, normalizer) = job
+  soup = OOsoup.make_soup(piece, parser)
+  counts = cleanup(soup, em_classes, strong_classes, blockquote)
+  post_counts = new_post_counts()
+  lines = list(body_lines(io.StringIO(normalizers[normalizer](str(soup))), post_counts))
+  if not first:
+    post_counts['preamble_lines'] = 0
+    if lines and lines[0].strip().startswith("<body"):
+      lines = lines[1:]
+      post_counts['body_lines'] -= 1
+  return (lines, counts, post_counts)
+
+def add_counts(total, counts):
+  for k in counts:
+    total[k] += counts[k]
+
+#
+# a whole book for OOprep's batch mode, in a worker process: returns its
+#   counts and how long it took, or the error which stopped it, so one bad
+#   book doesn't stop the others
+#
+def prep_book(job):
+  (in_fn, out_fn, parser, blockquote, normalizer, use_css_cache) = job
+  t0 = time.perf_counter()
+  try:
+    with open(in_fn,'r') as in_fh:
+      gd_book = in_fh.read()
+    (em_classes, strong_classes) = special_classes(OOcss.load_index(in_fn, text=gd_book, use_cache=use_css_cache))
+    (lines, counts, post_counts) = prep_chapter((gd_book, True, parser, em_classes, strong_classes, blockquote, normalizer))
+    with open(out_fn, 'w') as out_fh:
+      out_fh.writelines(lines)
+  except (ValueError, OSError) as e:
+    return (None, None, time.perf_counter()-t0, str(e))
+  return (counts, post_counts, time.perf_counter()-t0, "")
+
+#
+# bounded-memory preparation (OOprep --stream): the input is read a little
+#   at a time through an incremental HTMLParser which cuts the body into its
+#   top-level elements; these are gathered into batches of about
+#   stream_batch_size characters, each cleaned and tidied like a piece from
+#   split_chapters() and written out before the next is read.  The events are
+#   turned back into the original markup, so a batch is just a slice of the
+#   input
+#
+stream_chunk_size = 1<<16
+stream_batch_size = 1<<18
+void_tags = ['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source', 'track', 'wbr']
+
+class BlockSplitter(html.parser.HTMLParser):
+  def __init__(self, on_body, on_block):
+    super().__init__(convert_charrefs=False)
+    self.on_body = on_body
+    self.on_block = on_block
+    self.where = "head"
+    self.depth = 0
+    self.head = []
+    self.buf = []
+    self.tail = []
+
+  def raw(self, s):
+    if self.where == "head":
+      self.head.append(s)
+    elif self.where == "body":
+      self.buf.append(s)
+    else:
+      self.tail.append(s)
+
+  def block_done(self):
+    if self.depth <= 0:
+      self.depth = 0
+      self.on_block("".join(self.buf))
+      self.buf = []
+
+  def handle_starttag(self, tag, attrs):
+    if self.where == "head" and tag == "body":
+      self.where = "body"
+      self.on_body("".join(self.head), self.get_starttag_text())
+      self.head = []
+      return
+    self.raw(self.get_starttag_text())
+    if self.where == "body" and tag not in void_tags:
+      self.depth += 1
+    elif self.where == "body":
+      self.block_done()
+
+  def handle_startendtag(self, tag, attrs):
+    self.raw(self.get_starttag_text())
+    if self.where == "body":
+      self.block_done()
+
+  def handle_endtag(self, tag):
+    if self.where == "body" and tag == "body":
+      self.on_block("".join(self.buf))
+      self.buf = []
+      self.where = "tail"
+    self.raw(f"</{tag}>")
+    if self.where == "body" and tag not in void_tags:
+      self.depth -= 1
+      self.block_done()
+
+  def handle_data(self, data):
+    self.raw(data)
+
+  def handle_entityref(self, name):
+    self.raw(f"&{name};")
+
+  def handle_charref(self, name):
+    self.raw(f"&#{name};")
+
+  def handle_comment(self, data):
+    self.raw(f"<!--{data}-->")
+
+  def handle_decl(self, decl):
+    self.raw(f"<!{decl}>")
+
+  def handle_pi(self, data):
+    self.raw(f"<?{data}>")
+
+  def unknown_decl(self, data):
+    self.raw(f"<![{data}]>")
+
+def stream_prep(in_fh, out_fh, parser, em_classes, strong_classes, blockquote, normalizer, counts, post_counts):
+  state = {'head': "", 'body_tag': "", 'first': True, 'batch': [], 'size': 0}
+  def flush(tail):
+    if state['first']:
+      piece = state['head']+state['body_tag']
+    else:
+      piece = "<html>"+state['body_tag']
+    piece += "".join(state['batch'])+tail
+    (lines, batch_counts, batch_post_counts) = prep_chapter((piece, state['first'], parser, em_classes, strong_classes, blockquote, normalizer))
+    out_fh.writelines(lines)
+    add_counts(counts, batch_counts)
+    add_counts(post_counts, batch_post_counts)
+    state['first'] = False
+    state['batch'] = []
+    state['size'] = 0
+  def on_body(head, body_tag):
+    state['head'] = head
+    state['body_tag'] = body_tag
+  def on_block(block):
+    state['batch'].append(block)
+    state['size'] += len(block)
+    if state['size'] >= stream_batch_size:
+      flush("</body></html>")
+  splitter = BlockSplitter(on_body, on_block)
+  while True:
+    chunk = in_fh.read(stream_chunk_size)
+    if not chunk:
+      break
+    splitter.feed(chunk)
+  splitter.close()
+  if splitter.where == "head":
+    raise ValueError("malformed HTML file: no <body> found")
+  if splitter.where == "body":
+    on_block("".join(splitter.buf))
+  flush("".join(splitter.tail) or "</body></html>")
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 Jonathan A. Poritz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# An index of the classes defined in the <style> block of a GD html file:
+#   class name -> {property: value}, and the class rules it is made from.
+#   If asked, the rules are cached in a sidecar file next to the html file,
+#   keyed by that file's size and modification time.  Not meant to be run by
+#   itself.
+#
+import json
+import os
+import re
+style_pat = re.compile(r'<style[^>]*>(.*?)</style>', re.IGNORECASE | re.DOTALL)
+rule_pat = re.compile(r'([^{}]+)\{([^{}]*)\}')
+class_selector_pat = re.compile(r'\.([A-Za-z_][A-Za-z0-9_-]*)$')
+body_pat = re.compile(r'<body[\s>]', re.IGNORECASE)
+sidecar_suffix = ".css.json"
+read_size = 1<<16
+
+#
+# only rules whose selector is a single class (like GD's ".c12{...}") are
+#   kept, as a list of [class name, declarations as written], in the order
+#   they are in the stylesheet
+#
+def class_rules(text):
+  rules = []
+  for style in style_pat.findall(text):
+    for m in rule_pat.finditer(style):
+      for selector in m.group(1).split(","):
+        c = class_selector_pat.match(selector.strip())
+        if c:
+          rules.append([c.group(1), m.group(2)])
+  return rules
+
+#
+# the index of the rules: a class defined more than once gets all its
+#   declarations merged
+#
+def index_rules(rules):
+  index = {}
+  for (c, decls) in rules:
+    props = index.setdefault(c, {})
+    for d in decls.split(";"):
+      if ":" in d:
+        (prop, value) = d.split(":", 1)
+        props[prop.strip().lower()] = value.strip()
+  return index
+
+def index_css(text):
+  return index_rules(class_rules(text))
+
+#
+# classes whose declarations are exactly the given ones, as for the GD classes
+#   that just make text italic or bold
+#
+def classes_with_only(index, decls):
+  return [c for c in index if index[c] == decls]
+
+def color_classes(index):
+  return [c for c in index if "color" in index[c]]
+
+def em_classes(index):
+  return classes_with_only(index, {"font-style": "italic"})
+
+def strong_classes(index):
+  return classes_with_only(index, {"font-weight": "700"})
+
+#
+# the part of an html file before its <body>, read only as far as needed
+#
+def read_head(fn):
+  head = ""
+  with open(fn, 'r') as fh:
+    while True:
+      chunk = fh.read(read_size)
+      if not chunk:
+        return head
+      head += chunk
+      m = body_pat.search(head, max(0, len(head)-len(chunk)-5))
+      if m:
+        return head[:m.start()]
+
+def file_key(fn):
+  st = os.stat(fn)
+  return [st.st_size, st.st_mtime_ns]
+
+#
+# the rules for html file fn, from its head (or from text, if the caller
+#   already has the file's contents).  With use_cache, they come from the
+#   sidecar file instead if that was made from the file as it is now (by its
+#   size and modification time, so the html itself is not read at all), and
+#   otherwise are saved there
+#
+def load_rules(fn, text=None, use_cache=False):
+  if not use_cache:
+    return class_rules(text if text is not None else read_head(fn))
+  sidecar = fn+sidecar_suffix
+  key = file_key(fn)
+  if os.path.exists(sidecar):
+    try:
+      with open(sidecar, 'r') as fh:
+        cached = json.load(fh)
+      if cached.get("key") == key:
+        return cached["rules"]
+    except (ValueError, KeyError):
+      pass
+  rules = class_rules(text if text is not None else read_head(fn))
+  try:
+    with open(sidecar, 'w') as fh:
+      json.dump({"key": key, "rules": rules}, fh)
+  except OSError:
+    pass
+  return rules
+
+def load_index(fn, text=None, use_cache=False):
+  return index_rules(load_rules(fn, text, use_cache))
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 Jonathan A. Poritz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+import argparse
+import os
+import random
+#
+# preset book sizes, as used by "OObench.py suite": chapters, sections per
+#   chapter, paragraphs, images, tables and lists per section, links per
+#   paragraph and glossary terms
+#
+book_sizes = {
+  'small': {'chapters': 5, 'sections': 4, 'paragraphs': 8, 'images': 2, 'tables': 1, 'lists': 1, 'links': 1, 'terms': 100},
+  'medium': {'chapters': 15, 'sections': 6, 'paragraphs': 12, 'images': 3, 'tables': 1, 'lists': 2, 'links': 1, 'terms': 1000},
+  'large': {'chapters': 40, 'sections': 8, 'paragraphs': 15, 'images': 4, 'tables': 2, 'lists': 2, 'links': 2, 'terms': 10000},
+}
+#
+# the stylesheet of a GD export: c3 and c7 are the plain italic and bold
+#   classes OOprep turns into <em> and <strong>, c12 is the class GD puts on
+#   almost every span
+#
+gd_style = ('ol{margin:0;padding:0}table td,table th{padding:0}'
+  '.c1{padding-top:0pt;padding-bottom:0pt;line-height:1.15;orphans:2;widows:2;text-align:left}'
+  '.c2{padding:0;margin:0}.c3{font-style:italic}.c4{padding-top:20pt;padding-bottom:6pt;line-height:1.15;page-break-after:avoid;orphans:2;widows:2;text-align:left}'
+  '.c5{border-spacing:0;border-collapse:collapse;margin-right:auto}.c6{height:0pt}.c7{font-weight:700}'
+  '.c8{color:#1155cc;text-decoration:underline}.c9{color:#ff0000;font-weight:700}'
+  '.c11{border-right-style:solid;padding:5pt 5pt 5pt 5pt;border-bottom-color:#000000;border-top-width:1pt;vertical-align:top}'
+  '.c12{color:#000000;font-weight:400;text-decoration:none;vertical-align:baseline;font-size:11pt;font-family:"Arial";font-style:normal}'
+  '.c14{margin-left:36pt}.c15{font-style:italic;color:#1155cc}.c16{margin-left:72pt;padding-left:0pt}'
+  '.c20{background-color:#ffffff;max-width:468pt;padding:72pt 72pt 72pt 72pt}'
+  '.title{padding-top:0pt;color:#000000;font-size:26pt;padding-bottom:3pt;font-family:"Arial";line-height:1.15;page-break-after:avoid;orphans:2;widows:2;text-align:left}')
+consonants = "bcdfghjklmnprstvwxz"
+vowels = "aeiou"
+syllables = [c+v for c in consonants for v in vowels]
+
+class BookWriter:
+  def __init__(self, sizes, seed):
+    self.sizes = sizes
+    self.rnd = random.Random(seed)
+    self.ids = 0
+    self.lists = 0
+    self.images = 0
+    self.terms = self.glossary_terms(sizes['terms'])
+
+  #
+  # made-up glossary terms of three syllables each: all the same length, so
+  #   none can be part of another, which OOadd_glossary would refuse
+  #
+  def glossary_terms(self, n):
+    terms = set()
+    while len(terms) < min(n, len(syllables)**3):
+      terms.add("".join(self.rnd.choice(syllables) for i in range(3)))
+    return sorted(terms)
+
+  def word(self):
+    return "".join(self.rnd.choice(syllables) for i in range(self.rnd.randint(1, 4)))
+
+  def words(self, n):
+    return " ".join(self.word() for i in range(n))
+
+  def gd_id(self):
+    self.ids += 1
+    return f'h.{self.ids:x}{self.rnd.randrange(1<<24):06x}'
+
+  def redirect(self, url):
+    return f'https://www.google.com/url?q={url}&amp;sa=D&amp;source=editors&amp;ust=16{self.rnd.randrange(10**11):011d}&amp;usg=AOvVaw{self.rnd.randrange(1<<60):015x}'
+
+  #
+  # each of the pieces below comes in two forms: as GD exports it, and as
+  #   the lines of a tidy_book.html after OOprep and the hand fixes of the
+  #   workflow (see wf), which is what OOsplit, OOfig_finder, OOlink_finder
+  #   and so on read
+  #
+
+  #
+  # a paragraph with the usual GD clutter: runs of c12 spans, italic and bold
+  #   spans, Google redirect links, the occasional glossary term, empty span
+  #   and &nbsp;s
+  #
+  def paragraph(self, chap, sect, n):
+    gd = []
+    prep = []
+    for i in range(self.rnd.randint(3, 6)):
+      text = self.words(self.rnd.randint(5, 15))
+      gd.append(f'<span class="c12">{text} </span>')
+      prep.append(text+" ")
+      r = self.rnd.random()
+      if r < 0.2:
+        text = self.words(2)
+        gd.append(f'<span class="c3">{text}</span><span class="c12">&nbsp;</span>')
+        prep.append(f'<em>{text}</em> ')
+      elif r < 0.35:
+        text = self.words(2)
+        gd.append(f'<span class="c7">{text}</span>')
+        prep.append(f'<strong>{text}</strong>')
+      elif r < 0.45 and self.terms:
+        text = self.rnd.choice(self.terms)
+        gd.append(f'<span class="c12">{text} </span>')
+        prep.append(text+" ")
+      elif r < 0.5:
+        gd.append('<span class="c12"></span>')
+    for i in range(self.sizes['links']):
+      (url, text) = (f"https://example.org/{chap}/{sect}/{n}/{i}", self.words(3))
+      k = self.rnd.randint(0, len(gd))
+      gd.insert(k, f'<span class="c8"><a class="c8" href="{self.redirect(url)}">{text}</a></span>')
+      prep.insert(k, f'<a href="{url}">{text}</a>')
+    return (f'<p class="c1" id="{self.gd_id()}">'+"".join(gd)+'</p>', ['<p>'+"".join(prep).strip()+'</p>'])
+
+  def image(self, chap, fig):
+    self.images += 1
+    (w, h) = (self.rnd.randint(200, 624), self.rnd.randint(150, 500))
+    (alt, caption, desc) = (self.words(6), f'Figure {chap}.{fig}. {self.words(8)}', f"https://example.org/desc/{chap}/{fig}")
+    gd = (f'<p class="c1"><span style="overflow: hidden; display: inline-block; margin: 0.00px 0.00px; border: 0.00px solid #000000; transform: rotate(0.00rad) translateZ(0px); -webkit-transform: rotate(0.00rad) translateZ(0px); width: {w}.00px; height: {h}.00px;">'
+      f'<img alt="{alt}" src="images/image{self.images}.png" style="width: {w}.00px; height: {h}.00px; margin-left: 0.00px; margin-top: 0.00px; transform: rotate(0.00rad) translateZ(0px); -webkit-transform: rotate(0.00rad) translateZ(0px);" title=""></span></p>'
+      f'<p class="c1"><span class="c12">{caption} </span><span class="c8"><a class="c8" href="{self.redirect(desc)}">Image description</a></span></p>')
+    return (gd, [f'<p><img alt="{alt}" src="images/image{self.images}.png"></p>', f'<p>{caption} <a href="{desc}">Image description</a></p>'])
+
+  def table(self):
+    gd = []
+    prep = ['<table>']
+    for r in range(self.rnd.randint(2, 5)):
+      cells = [self.words(3) for c in range(self.rnd.randint(2, 4))]
+      gd.append('<tr class="c6">'+"".join(f'<td class="c11" colspan="1" rowspan="1"><p class="c1"><span class="c12">{c}</span></p></td>' for c in cells)+'</tr>')
+      prep += ['<tr>']+[f'<td>{c}</td>' for c in cells]+['</tr>']
+    return ('<table class="c5">'+"".join(gd)+'</table><p class="c1 c14"><span class="c12"></span></p>', prep+['</table>'])
+
+  def list(self):
+    self.lists += 1
+    tag = self.rnd.choice(["ol", "ul"])
+    items = [self.words(self.rnd.randint(3, 10)) for i in range(self.rnd.randint(2, 6))]
+    gd = "".join(f'<li class="c1 c16 li-bullet-0"><span class="c12">{t}</span></li>' for t in items)
+    return (f'<{tag} class="c2 lst-kix_list_{self.lists}-0 start">{gd}</{tag}>', [f'<{tag}>']+[f'<li>{t}</li>' for t in items]+[f'</{tag}>'])
+
+  def section(self, chap, sect, fig):
+    title = f'{chap}.{sect} {self.words(3).title()}'
+    blocks = [self.paragraph(chap, sect, n) for n in range(self.sizes['paragraphs'])]
+    #
+    # figures go in numbered in order
+    #
+    for (i, k) in enumerate(sorted(self.rnd.randint(0, len(blocks)) for i in range(self.sizes['images']))):
+      fig += 1
+      blocks.insert(k+i, self.image(chap, fig))
+    for i in range(self.sizes['tables']):
+      blocks.insert(self.rnd.randint(0, len(blocks)), self.table())
+    for i in range(self.sizes['lists']):
+      blocks.insert(self.rnd.randint(0, len(blocks)), self.list())
+    sub = f'{chap}.{sect}.1 {self.words(2).title()}'
+    blocks.insert(self.rnd.randint(0, len(blocks)), (f'<h3 class="c4" id="{self.gd_id()}"><span class="c12">{sub}</span></h3>', [f'<h3>{sub}</h3>']))
+    gd = f'<h2 class="c4" id="{self.gd_id()}"><span class="c12">{title}</span></h2>'+"".join(b[0] for b in blocks)+'<p class="c1"><span class="c12"></span></p><h3 class="c4"><span class="c12"></span></h3>'
+    return (gd, [f'<h2>{title}</h2>']+[l for b in blocks for l in b[1]], fig)
+
+  #
+  # the whole book in both forms; a chapter heading in tidy_book.html is
+  #   laid out as OOsplit reads it, with its number on the line after the
+  #   closing "</h1>" line
+  #
+  def book(self):
+    title = self.words(4).title()
+    gd = [f'<html><head><meta content="text/html; charset=UTF-8" http-equiv="content-type"><style type="text/css">{gd_style}</style></head><body class="c20 doc-content">',
+      f'<p class="c1 title" id="{self.gd_id()}"><span class="c12">{title}</span></p>']
+    prep = [f'<p>{title}</p>']
+    for chap in range(1, self.sizes['chapters']+1):
+      heading = f'Chapter {chap}: {self.words(3).title()}'
+      gd.append(f'<h1 class="c4" id="{self.gd_id()}"><span class="c12">{heading}</span></h1>')
+      prep += [f'<h1>{heading}</h1>', '<h1>', '</h1>', f'<p>{chap}</p>']
+      fig = 0
+      for sect in range(1, self.sizes['sections']+1):
+        (g, p, fig) = self.section(chap, sect, fig)
+        gd.append(g)
+        prep += p
+    gd.append('</body></html>')
+    return ("".join(gd), "\n".join(prep)+"\n")
+
+  #
+  # what PB gives back after the images are uploaded, for OOsplit -i
+  #
+  def pb_imgs(self):
+    imgs = "\n".join(f'<p><img class="alignnone size-full wp-image-{1000+i}" src="https://pb.example.org/app/uploads/sites/1/2023/01/image{i}.png" alt="" width="624" height="351" /></p>' for i in range(1, self.images+1))
+    return f'<html><head><title>PB images</title></head><body>\n{imgs}\n</body></html>\n'
+
+  #
+  # a glossary manifest and definition files in the form OOgloss_down.py
+  #   writes them, for OOadd_glossary.py
+  #
+  def write_glossary(self, dir, manifest="glossary_manifest"):
+    os.makedirs(dir, exist_ok=True)
+    with open(os.path.join(dir, manifest), 'w') as manifest_fh:
+      manifest_fh.write("# made by OOgen_book.py\n")
+      for (i, t) in enumerate(self.terms):
+        def_fn = os.path.join(dir, str(i))
+        manifest_fh.write(f"GL[{1000+i}]: {t}\n{def_fn}\n")
+        with open(def_fn, 'w') as def_fh:
+          def_fh.write(f'<p>{self.words(12)}</p>\n')
+
+#
+# write book.html, its prepared form prepared_book.html, pb_imgs.html and a
+#   glossary directory into dir, returning the names of those files
+#
+def generate(dir, sizes, seed=0):
+  os.makedirs(dir, exist_ok=True)
+  writer = BookWriter(sizes, seed)
+  (gd, prep) = writer.book()
+  book_fn = os.path.join(dir, "book.html")
+  with open(book_fn, 'w') as fh:
+    fh.write(gd)
+  prepared_fn = os.path.join(dir, "prepared_book.html")
+  with open(prepared_fn, 'w') as fh:
+    fh.write(prep)
+  imgs_fn = os.path.join(dir, "pb_imgs.html")
+  with open(imgs_fn, 'w') as fh:
+    fh.write(writer.pb_imgs())
+  glossary_dir = os.path.join(dir, "glossary")
+  writer.write_glossary(glossary_dir)
+  return {'book': book_fn, 'prepared_book': prepared_fn, 'pb_imgs': imgs_fn, 'glossary_manifest': os.path.join(glossary_dir, "glossary_manifest"), 'images': writer.images}
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Generates a synthetic GD html export ("book.html"), with the GD quirks OOprep handles, together with the same book as it would be after OOprep and the hand fixes before OOsplit ("prepared_book.html"), a matching PB images file ("pb_imgs.html") for OOsplit and a glossary manifest for OOadd_glossary, for testing and benchmarking')
+  parser.add_argument("-o", "--output", help='directory in which to write the files; default is "synthetic_book"', default="synthetic_book")
+  parser.add_argument("--size", help="preset size to start from; default is small", choices=list(book_sizes), default="small")
+  parser.add_argument("-c", "--chapters", help="number of chapters", type=int)
+  parser.add_argument("-s", "--sections", help="number of sections per chapter", type=int)
+  parser.add_argument("-p", "--paragraphs", help="number of paragraphs per section", type=int)
+  parser.add_argument("-i", "--images", help="number of images (each with a caption) per section", type=int)
+  parser.add_argument("-t", "--tables", help="number of tables per section", type=int)
+  parser.add_argument("--lists", help="number of lists per section", type=int)
+  parser.add_argument("-k", "--links", help="number of links per paragraph", type=int)
+  parser.add_argument("-g", "--terms", help="number of glossary terms", type=int)
+  parser.add_argument("--seed", help="random seed, so the same options always give the same book; default is 0", type=int, default=0)
+  args = parser.parse_args()
+  sizes = dict(book_sizes[args.size])
+  for k in sizes:
+    if getattr(args, k) is not None:
+      sizes[k] = getattr(args, k)
+  made = generate(args.output, sizes, args.seed)
+  print(f'Wrote {made["book"]} ({os.path.getsize(made["book"])} bytes, {made["images"]} images), {made["prepared_book"]}, {made["pb_imgs"]} and {made["glossary_manifest"]}')
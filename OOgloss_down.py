@@ -16,10 +16,12 @@ import argparse
 import fileinput
 import os
 import code
+import html
 import re
 import sys
 import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 if not sys.warnoptions:
     warnings.simplefilter("ignore")
 parser = argparse.ArgumentParser(description='Downloads PB glossary terms from an OO OER, making a glossary manifest file, consisting of a pair of lines for each term, the first being "GL[<post_id>]: <term>" and the second just containing the filename indicating where the HTML for the term\'s definition can be found.')
@@ -28,6 +30,7 @@ parser.add_argument("-m", "--manifest", help='filename for manifest to be made i
 parser.add_argument("-l", "--logfile", help='Filename for logfile to which will be appended detailed progress information; default is "gloss_down.log".', default="gloss_down.log", type=argparse.FileType('a'))
 parser.add_argument('-v', '--verbose', help="print on console all information also going in to the logfile", action='store_true')
 parser.add_argument("-o", "--output", help='Name of directory where manifest and HTML files will be placed; default is "PBglossary"', default="PBglossary")
+parser.add_argument("-j", "--jobs", help="how many definitions to download at once; default is 8", type=int, default=8)
 args = parser.parse_args()
 output = args.output
 verbose = args.verbose
@@ -81,6 +84,7 @@ if cline[:10] != 'Password: ':
 PB_password = cline[10:].strip()
 log_and_print('Got account password from credentials file')
 args.credentials_file.close()
+import requests
 from selenium.webdriver import Firefox
 from selenium.webdriver.firefox.options import Options
 opts = Options()
@@ -125,17 +129,64 @@ while True:
     break
   page_no += 1
   browser.get(f"{PB_url_root}/wp-admin/edit.php?post_type=glossary&mode=list&paged={page_no}")
+#
+# the definitions are read from the terms' edit pages several at a time,
+#   outside the browser but with its login cookies.  What is wanted is what
+#   the browser would give as the innerHTML of the (first) <textarea>: its
+#   text, as the browser parses it, with &, <, > and non-breaking spaces
+#   escaped again.  A page without one (say, if the cookies didn't work) is
+#   left for the browser to get
+#
+textarea_pat = re.compile(r'<textarea[^>]*>(.*?)</textarea', re.IGNORECASE | re.DOTALL)
+def textarea_html(page):
+  m = textarea_pat.search(page)
+  if not m:
+    return None
+  text = m.group(1).replace("\r\n", "\n").replace("\r", "\n")
+  if text[:1] == "\n":
+    text = text[1:]
+  text = html.unescape(text)
+  return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace("\xa0", "&nbsp;")
+cookies = requests.cookies.RequestsCookieJar()
+for c in browser.get_cookies():
+  cookies.set(c['name'], c['value'], domain=c.get('domain', ''), path=c.get('path', '/'))
+headers = {'User-Agent': browser.execute_script("return navigator.userAgent")}
+#
+# the definition from glossary item edit page URL l, or None (having logged
+#   why) if it couldn't be downloaded
+#
+def fetch_definition(l):
+  try:
+    res = requests.get(l, cookies=cookies, headers=headers, timeout=60)
+  except requests.RequestException as e:
+    log_and_print(f"could not download {l}: {e}")
+    return None
+  if res.status_code != 200:
+    log_and_print(f"could not download {l}: HTTP status {res.status_code}")
+    return None
+  definition = textarea_html(res.text)
+  if definition is None:
+    log_and_print(f"could not download {l}: no textarea in the page")
+  return definition
+log_and_print(f"Downloading {len(terms)} definitions, {args.jobs} at a time")
 term_count = 0
-for t, l, i in zip(terms, edit_links, post_ids):
-  manifest_fh.write(f"GL[{i}]: {t}\n{output}{str(term_count)}\n")
-  browser.get(l)
-  ta = browser.find_element_by_tag_name("textarea")
-  definition = ta.get_attribute("innerHTML")
-  def_fh = open(output+str(term_count),"w")
-  def_fh.write(definition)
-  def_fh.close()
-  log_and_print(f'file "{output+str(term_count)}" has def of glossary item: {t}')
-  term_count += 1
+#
+# map() gives the definitions back in order, so the manifest and definition
+#   files come out the same however the downloads finish
+#
+with ThreadPoolExecutor(max(1, args.jobs)) as pool:
+  for t, l, i, definition in zip(terms, edit_links, post_ids, pool.map(fetch_definition, edit_links)):
+    manifest_fh.write(f"GL[{i}]: {t}\n{output}{str(term_count)}\n")
+    if definition is None:
+      log_and_print(f'could not download the edit page of glossary item: {t}, so getting it with the browser')
+      browser.get(l)
+      ta = browser.find_element_by_tag_name("textarea")
+      definition = ta.get_attribute("innerHTML")
+    def_fh = open(output+str(term_count),"w")
+    def_fh.write(definition)
+    def_fh.close()
+    log_and_print(f'file "{output+str(term_count)}" has def of glossary item: {t}')
+    term_count += 1
 if term_count:
   log_and_print(f"Successfully downloaded definitions for {term_count} terms")
 else:
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 Jonathan A. Poritz
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+import argparse
+import os
+import sys
+import warnings
+import OOglossary
+if not sys.warnoptions:
+    warnings.simplefilter("ignore")
+parser = argparse.ArgumentParser(description='Reports where glossary terms are activated in the html files of a book, as "filename:line:offset", from the index which OOadd_glossary.py keeps next to the manifest, without reading the files themselves.')
+parser.add_argument("terms", help="glossary terms to look for (in any case)", nargs="+")
+parser.add_argument("-m","--manifest", help='manifest as given to OOadd_glossary.py, next to which is its index; default is "manifest"', default="manifest")
+parser.add_argument('-c', '--counts', help="print only how many times each term is activated, and in how many files", action='store_true')
+args = parser.parse_args()
+index_fn = args.manifest+OOglossary.index_suffix
+if not os.path.exists(index_fn):
+  raise ValueError(f"No glossary index {index_fn}: run OOadd_glossary.py with manifest {args.manifest} first")
+index = OOglossary.load_occurrence_index(index_fn)
+ids = {t.lower(): id for (t, id) in index["terms"].items()}
+for t in args.terms:
+  id = ids.get(t.lower())
+  if id is None:
+    print(f'"{t}" is not in the glossary last used by OOadd_glossary.py')
+    continue
+  n = 0
+  files = 0
+  for (fn, entry) in index["files"].items():
+    where = entry["occurrences"].get(id, [])
+    if where:
+      files += 1
+    n += len(where)
+    if not args.counts:
+      for (line_no, offset) in where:
+        print(f'{fn}:{line_no}:{offset}')
+  print(f'"{t}" (post id {id}) is activated {n} times in {files} files')
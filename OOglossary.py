@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 Jonathan A. Poritz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# Glossary terms, for OOadd_glossary.py and OObench.py: reading a glossary
+#   manifest as written by OOgloss_down.py, and a matcher which finds every
+#   glossary term in a line, in any case, in one pass.  The matcher is a
+#   single regex made from a trie of all the (lower-cased) terms, so at each
+#   place in the line re only follows the one path through the trie which
+#   the text there allows, rather than trying every term in turn, and where
+#   two terms start at the same place the longer wins.  Also activating the
+#   terms in whole files, in worker processes if need be, keeping an index of
+#   where they were activated (so that files which haven't changed need not
+#   be done again) and finding all the terms which appear inside other
+#   terms, which OOadd_glossary.py won't work with.  Not meant to be run by
+#   itself.
+#
+import collections
+import hashlib
+import json
+import os
+import re
+import shutil
+end = ""
+index_suffix = ".glossary.json"
+index_version = "1"
+#
+# a term which has already been activated; its text is left alone
+#
+shortcode_s = r'\[pb_glossary id="([^"]*)"\](?:.*?)\[/pb_glossary\]'
+shortcode_pat = re.compile(shortcode_s)
+#
+# lines which get no glossary terms: from a "References" or "Licenses and
+#   Attributions" heading up to the next other <h1> or image description,
+#   and (if asked) headings
+#
+refs_pat = re.compile("<h1>[1-9][0-9]?.[1-9][0-9]?.[1-9][0-9]? References</h1>")
+LandA_pat = re.compile("<h1>[1-9][0-9]?.[1-9][0-9]?.[1-9][0-9]? Licenses and Attributions")
+img_desc_pat = re.compile(r'<a id="fig[1-9][0-9]?.[1-9][0-9]?"></a><strong>Image Description')
+header_pat = re.compile(r'<h[1-5]>')
+
+#
+# the glossary manifest's entries, as a list of (post id, term, definition
+#   filename), skipping "#" lines
+#
+def read_glossary_manifest(fh):
+  glines = [gl for gl in fh if gl[0] != "#"]
+  entries = []
+  for i in range(0, len(glines), 2):
+    gline = glines[i]
+    if i+1 >= len(glines) or not glines[i+1].strip():
+      raise ValueError(f"Malformed glossary manifest file: no filename for content line {gline}")
+    t = gline[gline.find(":")+1:].strip()
+    if not t:
+      raise ValueError(f"Malformed glossary manifest file: no term on content line {gline}")
+    entries.append((gline[3:gline.find("]")], t, glines[i+1].strip()))
+  return entries
+
+#
+# a trie as nested dicts, one level per character, with end as the key
+#   marking where a term ends (its value being the term)
+#
+def make_trie(terms):
+  trie = {}
+  for t in terms:
+    node = trie
+    for c in t.lower():
+      node = node.setdefault(c, {})
+    node[end] = t
+  return trie
+
+def trie_pattern(node):
+  branches = [re.escape(c)+trie_pattern(child) for (c, child) in sorted(node.items()) if c != end]
+  if not branches:
+    return ""
+  if len(branches) == 1:
+    p = branches[0]
+    return "(?:"+p+")?" if end in node else p
+  return "(?:"+"|".join(branches)+")"+("?" if end in node else "")
+
+class GlossaryMatcher:
+  #
+  # terms is a list of glossary terms and ids a dict of their PB post ids
+  #
+  def __init__(self, terms, ids):
+    self.terms = terms
+    self.by_key = {t.lower(): t for t in terms}
+    self.shortcodes = {t: f'[pb_glossary id="{ids[t]}"]' for t in terms}
+    self.pat = re.compile("(?P<done>"+shortcode_s+")|"+trie_pattern(make_trie(terms)), re.IGNORECASE) if terms else None
+
+  #
+  # which term some matched text is (lower() and re's idea of ignoring case
+  #   differ for a very few characters, hence the slow way as a fallback)
+  #
+  def term_of(self, s):
+    t = self.by_key.get(s.lower())
+    if t is None:
+      t = next(t for t in self.terms if re.fullmatch(re.escape(t), s, re.IGNORECASE))
+    return t
+
+  #
+  # line l with every glossary term in it (but not already in a shortcode)
+  #   wrapped in its [pb_glossary] shortcode, and how many were, adding to
+  #   the per-term counts
+  #
+  def activate(self, l, counts):
+    if not self.pat:
+      return (l, 0)
+    n = 0
+    def wrap(m):
+      nonlocal n
+      if m.group("done"):
+        return m.group(0)
+      t = self.term_of(m.group(0))
+      counts[t] += 1
+      n += 1
+      return self.shortcodes[t]+m.group(0)+"[/pb_glossary]"
+    return (self.pat.sub(wrap, l), n)
+
+  #
+  # whether any of the terms is in text (other than in a shortcode)
+  #
+  def occurs_in(self, text):
+    return bool(self.pat) and any(not m.group("done") for m in self.pat.finditer(text))
+
+#
+# the matchers activate_file() uses, made once in each worker process: one for
+#   all the terms, and one for those new since the files were last done
+#
+worker_matcher = None
+worker_new_matcher = None
+def init_worker(terms, ids, new_terms=()):
+  global worker_matcher, worker_new_matcher
+  worker_matcher = GlossaryMatcher(terms, ids)
+  worker_new_matcher = GlossaryMatcher(new_terms, ids)
+
+#
+# for a worker process (after init_worker()): job is (filename,
+#   activationless, backup, sha256 of the file as it was last left, or None).
+#   A file which is still as it was last left is skipped unless one of the
+#   new terms is in it.  Otherwise the file's lines are gathered in a list as
+#   they are read and, if any glossary terms were activated, the file is
+#   rewritten (first copied to its name with "~" appended, with backup).  The
+#   result is the number activated, a dict of how many times each term was
+#   and the file's new entry for the index (None if it was skipped)
+#
+def activate_file(job):
+  (fn, activationless, backup, known_sha256) = job
+  if known_sha256:
+    with open(fn, 'rb') as fh:
+      data = fh.read()
+    if hashlib.sha256(data).hexdigest() == known_sha256 and not worker_new_matcher.occurs_in(data.decode()):
+      return (0, {}, None)
+  counts = collections.Counter()
+  fixes = 0
+  new_lines = []
+  no_gloss = False
+  with open(fn, 'r') as fh:
+    for l in fh:
+      if no_gloss:
+        if img_desc_pat.match(l) or (l[:4]=="<h1>" and not (refs_pat.match(l) or LandA_pat.match(l))):
+          no_gloss = False
+      elif refs_pat.match(l) or LandA_pat.match(l):
+        no_gloss = True
+      elif not (activationless and header_pat.match(l)):
+        (l, n) = worker_matcher.activate(l, counts)
+        fixes += n
+      new_lines.append(l)
+  if fixes:
+    if backup:
+      shutil.copyfile(fn, fn+"~")
+    with open(fn, 'w') as fh:
+      fh.write("".join(new_lines))
+  return (fixes, dict(counts), {"sha256": file_sha256(fn), "occurrences": occurrences(new_lines)})
+
+def file_sha256(fn):
+  with open(fn, 'rb') as fh:
+    return hashlib.sha256(fh.read()).hexdigest()
+
+#
+# where terms are activated in a file's lines: a dict from post id to a list
+#   of [line number, offset in the line] of its shortcodes
+#
+def occurrences(lines):
+  occ = {}
+  for (i, l) in enumerate(lines, 1):
+    if "[pb_glossary" in l:
+      for m in shortcode_pat.finditer(l):
+        occ.setdefault(m.group(1), []).append([i, m.start()])
+  return occ
+
+#
+# the index OOadd_glossary.py keeps next to a manifest: the glossary it last
+#   used ("terms", a dict from term to post id), whether that was with
+#   activationless, and for each file it has done, its sha256 as it was left
+#   and where the terms are activated in it; empty if there is no index
+#   (or one from another version of this)
+#
+def load_occurrence_index(fn):
+  try:
+    with open(fn, 'r') as fh:
+      index = json.load(fh)
+    if index.get("version") == index_version:
+      return index
+  except (OSError, ValueError):
+    pass
+  return empty_index()
+
+def empty_index():
+  return {"version": index_version, "terms": {}, "activationless": None, "files": {}}
+
+def save_occurrence_index(fn, index):
+  tmp = fn+f'.{os.getpid()}.tmp'
+  with open(tmp, 'w') as fh:
+    json.dump(index, fh)
+  os.replace(tmp, fn)
+
+#
+# every pair (i, j), in order, such that terms[i] appears (in any case) inside
+#   terms[j], found by running each term through an Aho-Corasick automaton
+#   made from all of them, so the time taken goes with the total length of
+#   the terms (plus the number of conflicts) rather than with the square of
+#   how many there are.  Two terms which are the same but for case conflict
+#   both ways
+#
+def conflicts(terms):
+  goto = [{}]
+  ends = [[]]
+  for (i, t) in enumerate(terms):
+    node = 0
+    for c in t.lower():
+      if c not in goto[node]:
+        goto[node][c] = len(goto)
+        goto.append({})
+        ends.append([])
+      node = goto[node][c]
+    ends[node].append(i)
+  #
+  # fail[n] is the node for the longest proper suffix of n's text which is
+  #   in the trie, and found[n] the nearest node along the fail links from n
+  #   where some term ends
+  #
+  fail = [0]*len(goto)
+  found = [0]*len(goto)
+  queue = collections.deque(goto[0].values())
+  while queue:
+    node = queue.popleft()
+    for (c, child) in goto[node].items():
+      f = fail[node]
+      while f and c not in goto[f]:
+        f = fail[f]
+      fail[child] = goto[f][c] if c in goto[f] and goto[f][c] != child else 0
+      found[child] = fail[child] if ends[fail[child]] else found[fail[child]]
+      queue.append(child)
+  pairs = set()
+  for (j, t) in enumerate(terms):
+    node = 0
+    for c in t.lower():
+      while node and c not in goto[node]:
+        node = fail[node]
+      node = goto[node].get(c, 0)
+      n = node
+      while n:
+        pairs.update((i, j) for i in ends[n] if i != j)
+        n = found[n]
+  return sorted(pairs)
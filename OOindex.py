@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 Jonathan A. Poritz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# A structural index of an html file such as the "tidy_book.html" produced
+#   by OOprep, kept in a sidecar file next to it, so the tools which work on
+#   that file can go straight to its headings, <img> lines, captions, links
+#   and the lines starting and ending lists and tables, rather than each
+#   rescanning the whole thing.  OOoutline (so OOoutliner, OOfig_finder and
+#   OOlink_finder), OOfind_img_tags and OOlink_finder use it.  The sidecar is
+#   a header (magic, size and sha256 of the html file, number of lines)
+#   followed by one fixed-width record per line, and is
+#   memory-mapped when it is read.  OOprep writes it; the other tools only
+#   write it (when it is missing or out of date) if asked to with
+#   --write_index, and otherwise just build it in memory.  Not meant to be
+#   run by itself.
+#
+import hashlib
+import mmap
+import os
+import re
+import struct
+sidecar_suffix = ".idx"
+magic = b"OOIDX003"
+header = struct.Struct("<8sQ32sQ")
+#
+# one record per line: byte offset of the line, heading level (0 if not a
+#   heading), number of <img> tags, and flags
+#
+record = struct.Struct("<QBHH")
+CAPTION = 1
+LINK = 2
+TABLE_START = 4
+OL_START = 8
+UL_START = 16
+TABLE_END = 32
+OL_END = 64
+UL_END = 128
+#
+# deliberately a little looser than the tests the tools make themselves, so
+#   that the index only ever narrows down which lines they need to look at
+#
+heading_pat = re.compile(rb'<h([1-5])[\s>]', re.IGNORECASE)
+img_pat = re.compile(rb'<img', re.IGNORECASE)
+caption_pat = re.compile(rb'\s*<p>[fF]igures? [1-9]')
+link_pat = re.compile(rb'<a', re.IGNORECASE)
+line_starts = [(b"<table", TABLE_START), (b"<ol", OL_START), (b"<ul", UL_START),
+  (b"</table>", TABLE_END), (b"</ol>", OL_END), (b"</ul>", UL_END)]
+
+def line_record(offset, line):
+  m = heading_pat.search(line)
+  flags = 0
+  if caption_pat.match(line):
+    flags |= CAPTION
+  if link_pat.search(line):
+    flags |= LINK
+  for (start, flag) in line_starts:
+    if line.startswith(start):
+      flags |= flag
+  return record.pack(offset, int(m.group(1)) if m else 0, min(len(img_pat.findall(line)), 0xffff), flags)
+
+def file_hash(fn):
+  h = hashlib.sha256()
+  with open(fn, 'rb') as fh:
+    for chunk in iter(lambda: fh.read(1<<16), b""):
+      h.update(chunk)
+  return h.digest()
+
+#
+# the index of html file fn as bytes, lines being as from
+#   open(fn).read().split("\n"), so there is a record for the empty "line"
+#   after a final newline
+#
+def build_index(fn):
+  h = hashlib.sha256()
+  records = []
+  offset = 0
+  with open(fn, 'rb') as fh:
+    for line in fh:
+      h.update(line)
+      records.append(line_record(offset, line))
+      offset += len(line)
+    if not records or line.endswith(b"\n"):
+      records.append(line_record(offset, b""))
+  return header.pack(magic, offset, h.digest(), len(records))+b"".join(records)
+
+def write_index(fn):
+  index = build_index(fn)
+  tmp = fn+sidecar_suffix+f'.{os.getpid()}.tmp'
+  with open(tmp, 'wb') as fh:
+    fh.write(index)
+  os.replace(tmp, fn+sidecar_suffix)
+  return index
+
+class StructIndex:
+  def __init__(self, fn, buf):
+    self.fn = fn
+    self.buf = buf
+    (m, size, digest, self.n) = header.unpack_from(buf, 0)
+    self.sha256 = digest.hex()
+    self.fh = open(fn, 'rb')
+
+  def __len__(self):
+    return self.n
+
+  def __getitem__(self, i):
+    return record.unpack_from(self.buf, header.size+i*record.size)
+
+  def records(self):
+    return record.iter_unpack(memoryview(self.buf)[header.size:header.size+self.n*record.size])
+
+  #
+  # the text of line i, without its newline (which may be "\r\n"), read
+  #   straight from the file
+  #
+  def line(self, i):
+    self.fh.seek(self[i][0])
+    l = self.fh.readline().decode()
+    if l[-1:] == "\n":
+      l = l[:-1]
+    if l[-1:] == "\r":
+      l = l[:-1]
+    return l
+
+  def lines_where(self, test):
+    return [i for (i, r) in enumerate(self.records()) if test(r)]
+
+  def lines_with(self, flag):
+    return self.lines_where(lambda r: r[3] & flag)
+
+  def heading_lines(self):
+    return self.lines_where(lambda r: r[1])
+
+  def img_lines(self):
+    return self.lines_where(lambda r: r[2])
+
+  def caption_lines(self):
+    return self.lines_with(CAPTION)
+
+  def link_lines(self):
+    return self.lines_with(LINK)
+
+  def close(self):
+    self.fh.close()
+    if isinstance(self.buf, mmap.mmap):
+      self.buf.close()
+
+def add_index_argument(parser):
+  parser.add_argument("--write_index", help='if the structural index of the input file (see OOindex.py), in the file named like it with ".idx" added, is missing or out of date, write it there for the next tool to use rather than just building it in memory', action='store_true')
+
+#
+# the index for html file fn, from its sidecar if that was made from the file
+#   as it is now, otherwise built again (and, with write, the sidecar
+#   rewritten, if possible).  The file's size is checked first, and only if
+#   that matches is the file read to check its sha256: a modification time
+#   is no guide, as copying with cp -p, unzipping or a git checkout can give
+#   a changed file the same one
+#
+def load_index(fn, write=False):
+  sidecar = fn+sidecar_suffix
+  if os.path.exists(sidecar) and os.path.getsize(sidecar) >= header.size:
+    with open(sidecar, 'rb') as fh:
+      buf = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    (m, size, digest, n) = header.unpack_from(buf, 0)
+    if m == magic and len(buf) == header.size+n*record.size and size == os.path.getsize(fn) and digest == file_hash(fn):
+      return StructIndex(fn, buf)
+    buf.close()
+  if write:
+    try:
+      return StructIndex(fn, write_index(fn))
+    except OSError:
+      pass
+  return StructIndex(fn, build_index(fn))
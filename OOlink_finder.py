@@ -13,7 +13,10 @@
 # GNU General Public License for more details.
 #
 import argparse
-from bs4 import BeautifulSoup
+import bisect
+import OOindex
+import OOoutline
+import OOsoup
 import os
 import re
 import sys
@@ -29,6 +32,8 @@ parser.add_argument('-v', '--verbose', help="print on console all information al
 parser.add_argument("-o", "--output", help='Name to use as base of output file (before the ".html"). If absent, will be "links_from_" prepended to input file name (after any ".html", if present, is removed).', default="")
 parser.add_argument('-n', '--numbered_chapters', help='chapters have numbers, which are used in building the outline numbering', action='store_true')
 parser.add_argument('-c', '--context', help='in the HTML file with all figures, include a paragraph before and after the figure, to ', action='store_true')
+parser.add_argument('--no_outline_cache', help='do not use or write the ".outline.json" sidecar file with the outline of the input file', action='store_true')
+OOindex.add_index_argument(parser)
 args = parser.parse_args()
 verbose = args.verbose
 inputfile = args.inputfile
@@ -69,156 +74,95 @@ f'''<!DOCTYPE html>
 ''')
 whole_book = in_fh.read()
 book_lines = whole_book.split("\n")
-locations = []
-chap_no = 0
-sec_no = 0
-ssec_no = 0
-sssec_no = 0
-ssssec_no = 0
-nesting_warnings = 0
-this_location = ""
-lines2print=[]
+#
+# the book's structural index (see OOindex.py), which says which lines might
+#   be headings, have links or start or end lists and tables
+#
+index = OOindex.load_index(inputfile, args.write_index)
+#
+# the headings and their locations, from the book's outline (see OOoutline.py)
+#
+outline = OOoutline.index_outline(index, args.numbered_chapters, not args.no_outline_cache)
+for h in outline.headings:
+  for w in outline.warnings_at(h["line"]):
+    log_and_print(f'WARNING: on line {w["line"]}, with content\n{h["text"]}\n{w["message"]}')
+  log_and_print(f"found location {outline.location_of(h)}")
+heading_lines = set(outline.heading_lines())
+nesting_warnings = outline.nesting_warnings()
+#
+# how many <a>s each line has, only tokenizing the lines which the index
+#   says have any "<a"
+#
+a_counts = [0]*len(book_lines)
+for i in index.link_lines():
+  a_counts[i] = len(OOsoup.tags_of(book_lines[i])[0])
+#
+# where the lists and tables are: the lines which start a table, <ol> or <ul>,
+# and those which end one, in order, checking just the lines the index says
+# start with those tags
+#
+def lines_where(flag, test):
+  return [i for i in index.lines_with(flag) if test(book_lines[i])]
+
+table_starts = lines_where(OOindex.TABLE_START, lambda l: l[:6] == "<table")
+ol_starts = lines_where(OOindex.OL_START, lambda l: l[:3] == "<ol")
+ul_starts = lines_where(OOindex.UL_START, lambda l: l == "<ul>")
+table_ends = lines_where(OOindex.TABLE_END, lambda l: l == "</table>")
+ol_ends = lines_where(OOindex.OL_END, lambda l: l == "</ol>")
+ul_ends = lines_where(OOindex.UL_END, lambda l: l == "</ul>")
+index.close()
+#
+# the start of the block ending on the line before line_no, which must be
+# before that line (and not the very first line of the book): the last start
+# at or before line line_no-2
+#
+def block_start(starts, line_no, what):
+  k = bisect.bisect_right(starts, line_no-2)-1 if line_no >= 2 else -1
+  start = starts[k] if k >= 0 else None
+  if start is None or (start == 0 and line_no-2 > 0):
+    raise ValueError(f"{what} near line {line_no} seems to have no start!")
+  return start
+
+#
+# the first end at or after line line_no
+#
+def block_end(ends, line_no, what):
+  k = bisect.bisect_left(ends, line_no)
+  end = ends[k] if line_no < len(book_lines) and k < len(ends) else None
+  if end is None:
+    raise ValueError(f"{what} near line {line_no} seems to have no end!")
+  return end
+
+lines2print=set()
 links=0
 link_lines=0
 html_lines=0
-def warn(s):
-  log_and_print(f'WARNING: on line {line_no}, with content\n{l}\n{s}')
 for line_no in range(len(book_lines)):
   l = book_lines[line_no]
-  if l[:4]=="<h1>":
-    lines2print.append(line_no)
+  if line_no in heading_lines:
+    lines2print.add(line_no)
     html_out.write(l+"\n")
-    if l[-5:]!="</h1>":
-      warn("expecting entire line bracketed in <h1>..</h1>")
-    if args.numbered_chapters:
-      num = l.split()[1]
-      if num[-1] == ":":
-        num = num[:-1]
-      chap_no = int(num)
-    else:
-      chap_no += 1
-    sec_no = 0
-    ssec_no = 0
-    sssec_no = 0
-    ssssec_no = 0
-    this_location=f"Chapter {chap_no}"
-    locations.append(this_location)
-    log_and_print(f"found location {this_location}")
-    continue
-  if l[:4]=="<h2>":
-    lines2print.append(line_no)
-    html_out.write(l+"\n")
-    if l[-5:]!="</h2>":
-      warn("expecting entire line bracketed in <h2>..</h2>")
-    if chap_no == 0:
-      nesting_warnings += 1
-      warn("Section without enclosing chapter")
-    sec_no += 1
-    ssec_no = 0
-    sssec_no = 0
-    ssssec_no = 0
-    this_location = f"{chap_no}.{sec_no}"
-    locations.append(this_location)
-    log_and_print(f"found location {this_location}")
-    continue
-  if l[:4]=="<h3>":
-    lines2print.append(line_no)
-    html_out.write(l+"\n")
-    if l[-5:]!="</h3>":
-      warn("expecting entire line bracketed in <h3>..</h3>")
-    if sec_no == 0:
-      nesting_warnings += 1
-      if chap_no == 0:
-        warn("Subsection without enclosing chapter or section")
-      else:
-        warn("Subsection without enclosing section")
-    ssec_no += 1
-    sssec_no = 0
-    ssssec_no = 0
-    this_location = f"{chap_no}.{sec_no}.{ssec_no}"
-    locations.append(this_location)
-    log_and_print(f"found location {this_location}")
-    continue
-  if l[:4]=="<h4>":
-    lines2print.append(line_no)
-    html_out.write(l+"\n")
-    if l[-5:]!="</h4>":
-      warn("expecting entire line bracketed in <h4>..</h4>")
-    if ssec_no ==0:
-      nesting_warnings += 1
-      if sec_no == 0:
-        if chap_no == 0:
-          warn("Subsubsection without enclosing chapter, section, or subsection")
-        else:
-          warn("Subsubsection without enclosing section or subsection")
-      else:
-        warn("Subsubsection without enclosing subsection")
-    sssec_no += 1
-    ssssec_no = 0
-    this_location = f"{chap_no}.{sec_no}.{ssec_no}.{sssec_no}"
-    locations.append(this_location)
-    log_and_print(f"found location {this_location}")
-    continue
-  if l[:4]=="<h5>":
-    lines2print.append(line_no)
-    html_out.write(l+"\n")
-    if l[-5:]!="</h5>":
-      warn("expecting entire line bracketed in <h5>..</h5>")
-    if sssec_no == 0:
-      nesting_warnings += 1
-      if ssec_no == 0:
-        if sec_no == 0:
-          if chap_no == 0:
-            warn("Subsubsubsection without enclosing chapter, section, subsection, or subsubsection")
-          else:
-            warn("Subsubsubsection without enclosing section, subsection, or subsubsection")
-        else:
-          warn("Subsubsubsection without enclosing subsection or subsubsection")
-      else:
-        warn("Subsubsubsection without enclosing subsubsection")
-    ssssec_no += 1
-    this_location = f"{chap_no}.{sec_no}.{ssec_no}.{sssec_no}.{ssssec_no}"
-    locations.append(this_location)
-    log_and_print(f"found location {this_location}")
     continue
-  locations.append(this_location)
-  soup=BeautifulSoup(l)
-  soup_a_list = soup.find_all("a")
-  if soup_a_list:
-    links += len(soup_a_list)
+  if a_counts[line_no]:
+    links += a_counts[line_no]
     link_lines += 1
     last_line_no = line_no-1
     if args.context:
       if not last_line_no in lines2print:
         if book_lines[last_line_no] == "</table>":
-          table_start=line_no-2
-          lines2print.append(table_start)
-          while book_lines[table_start][:6] != "<table":
-            table_start -= 1
-            lines2print.append(table_start)
-            if not table_start:
-              raise ValueError(f"table near line {line_no} seems to have no start!")
+          table_start = block_start(table_starts, line_no, "table")
+          lines2print.update(range(table_start, line_no-1))
           html_out.write('<table border="1px"\n')
           html_out.writelines(tablin+"\n" for tablin in book_lines[table_start+1:line_no])
         elif book_lines[last_line_no] == "</ol>":
-          list_start=line_no-2
-          lines2print.append(list_start)
-          while book_lines[list_start][:3] != "<ol":
-            list_start -= 1
-            lines2print.append(list_start)
-            if not list_start:
-              raise ValueError(f"ordered list near line {line_no} seems to have no start!")
+          list_start = block_start(ol_starts, line_no, "ordered list")
+          lines2print.update(range(list_start, line_no-1))
           html_out.writelines(listlin+"\n" for listlin in book_lines[list_start:line_no])
         elif book_lines[last_line_no] == "</ul>":
-          list_start=line_no-2
-          lines2print.append(list_start)
-          while book_lines[list_start] != "<ul>":
-            list_start -= 1
-            lines2print.append(list_start)
-            if not list_start:
-              raise ValueError(f"ordered list near line {line_no} seems to have no start!")
+          list_start = block_start(ul_starts, line_no, "ordered list")
+          lines2print.update(range(list_start, line_no-1))
           html_out.writelines(listlin+"\n" for listlin in book_lines[list_start:line_no])
-        lines2print.append(last_line_no)
+        lines2print.add(last_line_no)
         html_out.write(book_lines[last_line_no]+"\n")
       if l[:4] == "<li>":
         # go back and forward to get the entire list
@@ -227,56 +171,30 @@ for line_no in range(len(book_lines)):
         # go back and forward to get the entire table
         table_start=line_no-2
       else:
-        lines2print.append(line_no)
+        lines2print.add(line_no)
         html_out.write(l+"\n")
         next_line_no = line_no-1
+        block = None
         if book_lines[next_line_no][:6] == "<table":
-          table_end=next_line_no+1
-          lines2print.append(table_end)
-          while book_lines[table_end] != "</table>":
-            table_end += 1
-            lines2print.append(table_end)
-            inner_soup = BeautifulSoup(book_lines[table_end])
-            inner_soup_a_list = inner_soup.find_all("a")
-            if inner_soup_a_list:
-              links += len(inner_soup_a_list)
-              link_lines += 1
-            if table_end>len(book_lines):
-              raise ValueError(f"table near line {line_no} seems to have no end!")
+          block_first = next_line_no+1
+          block = block_end(table_ends, line_no, "table")
           html_out.write('<table border="1px"\n')
-          html_out.writelines(tablin+"\n" for tablin in book_lines[next_line_no+1:table_end+1])
         elif book_lines[next_line_no][:3] == "<ol":
-          list_end=next_line_no+1
-          lines2print.append(list_end)
-          while book_lines[list_end] != "</ol>":
-            list_end += 1
-            lines2print.append(list_end)
-            inner_soup = BeautifulSoup(book_lines[list_end])
-            inner_soup_a_list = inner_soup.find_all("a")
-            if inner_soup_a_list:
-              links += len(inner_soup_a_list)
-              link_lines += 1
-            if list_end>len(book_lines):
-              raise ValueError(f"ordered list near line {line_no} seems to have no end!")
-          html_out.writelines(listlin+"\n" for listlin in book_lines[next_line_no:list_end+1])
+          block_first = next_line_no
+          block = block_end(ol_ends, line_no, "ordered list")
         elif book_lines[next_line_no] == "<ul>":
-          list_end=next_line_no+1
-          lines2print.append(list_end)
-          while book_lines[list_end] != "</ul>":
-            list_end += 1
-            lines2print.append(list_end)
-            inner_soup = BeautifulSoup(book_lines[list_end])
-            inner_soup_a_list = inner_soup.find_all("a")
-            if inner_soup_a_list:
-              links += len(inner_soup_a_list)
-              link_lines += 1
-            if list_end>len(book_lines):
-              raise ValueError(f"ordered list near line {line_no} seems to have no end!")
-          html_out.writelines(listlin+"\n" for listlin in book_lines[next_line_no:list_end+1])
-        lines2print.append(last_line_no)
+          block_first = next_line_no
+          block = block_end(ul_ends, line_no, "ordered list")
+        if block is not None:
+          lines2print.update(range(line_no, block+1))
+          inner_counts = [n for n in a_counts[line_no+1:block+1] if n]
+          links += sum(inner_counts)
+          link_lines += len(inner_counts)
+          html_out.writelines(blocklin+"\n" for blocklin in book_lines[block_first:block+1])
+        lines2print.add(last_line_no)
         html_out.write(book_lines[last_line_no]+"\n")
     else:
-      lines2print.append(line_no)
+      lines2print.add(line_no)
       html_out.write(l+"\n")
 if nesting_warnings:
   if nesting_warnings >1:
@@ -289,10 +207,10 @@ html_out.write('<p>Please note that the material on this page <b>is not by Jonat
 html_out.write(f"<p>{when_work} at {time.strftime('%H:%M:%S')} did {what_work}</p>\n")
 html_out.write(f"<p>processed {len(book_lines)} lines of HTML</p>\n")
 html_out.write(f"<p>found {links} links on {link_lines} lines</p>\n")
-html_out.write(f"<p>wrote {len(set(lines2print))} lines of HTML output (not including header and footer)</p>\n")
+html_out.write(f"<p>wrote {len(lines2print)} lines of HTML output (not including header and footer)</p>\n")
 html_out.write("</body>\n</html>\n")
 html_out.close()
 log_and_print(f"processed {len(book_lines)} lines of HTML")
 log_and_print(f"found {links} links on {link_lines} lines")
-log_and_print(f"wrote {len(set(lines2print))} lines of HTML output (not including header and footer)")
+log_and_print(f"wrote {len(lines2print)} lines of HTML output (not including header and footer)")
 #code.interact(local=locals())
@@ -13,7 +13,7 @@
 # GNU General Public License for more details.
 #
 import code
-from bs4 import BeautifulSoup
+import OOsoup
 import requests
 import argparse
 import fileinput
@@ -32,6 +32,7 @@ parser.add_argument('-v', '--verbose', help="print on console all information al
 parser.add_argument('-c', '--context', help="print some context for each link listed", action='store_true')
 parser.add_argument('-s', '--start_from', help="skip all lines of the manifest up through the first one whose content title contains the given string", default='')
 parser.add_argument('-n', '--no_test_urls', help="do not test if the external URLs seem to be live; default: false", action='store_true')
+OOsoup.add_parser_argument(parser)
 args = parser.parse_args()
 verbose = args.verbose
 context = args.context
@@ -94,7 +95,7 @@ for fn in files2examine:
   title=file_mls[fn][:file_mls[fn].index("\n")]
   log_and_print(f'\n{"-"*(len(title)+2)}\n|{title}|\n{"-"*(max(len(title),len(fn))+2)}\n|{fn}|\n{"-"*(len(fn)+2)}')
   new_fh = open(fn,"r")
-  new_soup = BeautifulSoup(new_fh)
+  new_soup = OOsoup.make_soup(new_fh, args.parser)
   links = new_soup.find_all("a", href=True)
   for l in links:
     t = l.get_text()
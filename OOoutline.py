@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 Jonathan A. Poritz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# The outline of an html file such as the "tidy_book.html" produced by
+#   OOprep: its <h1>..<h5> headings with their chapter/section/... numbers,
+#   the location (like "Chapter 3" or "3.2.1") of every line, and warnings
+#   about headings which aren't a whole line or aren't properly nested.  It
+#   is made from just the lines which the file's structural index (see
+#   OOindex.py) says might be headings, and kept in a sidecar file next to
+#   the file, keyed by the sha256 of its contents (which the index already
+#   has), so that OOoutliner, OOfig_finder and OOlink_finder run one after
+#   another only make it once.  Not meant to be run by itself.
+#
+import bisect
+import json
+import OOindex
+sidecar_suffix = ".outline.json"
+outline_version = "2"
+level_names = ["Chapter", "Section", "Subsection", "Subsubsection", "Subsubsubsection"]
+enclosing_names = ["chapter", "section", "subsection", "subsubsection"]
+
+#
+# a line is a heading of level n if, stripped, it starts with <hn>
+#
+def heading_level(l):
+  if l[:2] == "<h" and l[2:3] in "12345" and l[3:4] == ">":
+    return int(l[2])
+  return 0
+
+#
+# e.g., "Subsection without enclosing chapter or section"
+#
+def nesting_message(level, numbers):
+  missing = [enclosing_names[k] for k in range(level-1) if not any(numbers[k:level-1])]
+  if len(missing) > 2:
+    missing = [", ".join(missing[:-1])+",", missing[-1]]
+  return level_names[level-1]+" without enclosing "+" or ".join(missing)
+
+class Outline:
+  #
+  # headings is a list, in order, of dicts with the heading's line index
+  #   ("line"), "level", "numbers" (as many as its level, e.g. [3, 2, 1] for
+  #   3.2.1), "text" (the stripped line) and "closed" (whether the line ends
+  #   with the matching close tag); warnings is a list of dicts with "line",
+  #   "kind" ("tag" or "nesting") and "message"
+  #
+  def __init__(self, n_lines, headings, warnings):
+    self.n_lines = n_lines
+    self.headings = headings
+    self.warnings = warnings
+    self.heading_starts = [h["line"] for h in headings]
+    self.warnings_by_line = {}
+    for w in warnings:
+      self.warnings_by_line.setdefault(w["line"], []).append(w)
+
+  def nesting_warnings(self):
+    return sum(1 for w in self.warnings if w["kind"] == "nesting")
+
+  def warnings_at(self, i):
+    return self.warnings_by_line.get(i, [])
+
+  def heading_lines(self):
+    return self.heading_starts
+
+  def location_of(self, heading):
+    if heading["level"] == 1:
+      return f'Chapter {heading["numbers"][0]}'
+    return ".".join(str(n) for n in heading["numbers"])
+
+  #
+  # the location of line i: that of the last heading at or before it, or ""
+  #
+  def location(self, i):
+    h = bisect.bisect_right(self.heading_starts, i)-1
+    return self.location_of(self.headings[h]) if h >= 0 else ""
+
+  def locations(self):
+    locations = []
+    this_location = ""
+    for h in self.headings:
+      locations += [this_location]*(h["line"]-len(locations))
+      this_location = self.location_of(h)
+    return locations+[this_location]*(self.n_lines-len(locations))
+
+  #
+  # the headings nested as they are in the book, each with its "children"
+  #
+  def tree(self):
+    root = {"level": 0, "children": []}
+    stack = [root]
+    for h in self.headings:
+      node = dict(h, location=self.location_of(h), children=[])
+      while stack[-1]["level"] >= h["level"]:
+        stack.pop()
+      stack[-1]["children"].append(node)
+      stack.append(node)
+    return root["children"]
+
+  def to_dict(self):
+    return {"lines": self.n_lines, "headings": self.headings, "warnings": self.warnings}
+
+def from_dict(d):
+  return Outline(d["lines"], d["headings"], d["warnings"])
+
+#
+# the outline of a book of n_lines lines, given (in order) as many of them as
+#   might be headings, each as (line index, text); with numbered_chapters,
+#   the chapter numbers are taken from the <h1>s (as in "<h1>Chapter 3:
+#   ..."), otherwise chapters are just counted.  For a file which is just part
+#   of a book, like one section from OOsplit, enclosing is the number of
+#   levels of heading it is already inside of
+#
+def build_outline(lines, n_lines, numbered_chapters=False, enclosing=0):
+  headings = []
+  warnings = []
+  numbers = [1]*enclosing+[0]*(5-enclosing)
+  for (i, l) in lines:
+    if "<h" not in l:
+      continue
+    l = l.strip()
+    level = heading_level(l)
+    if not level:
+      continue
+    closed = l[-5:] == f"</h{level}>"
+    if not closed:
+      warnings.append({"line": i, "kind": "tag", "message": f"expecting entire line bracketed in <h{level}>..</h{level}>"})
+    if level == 1:
+      if numbered_chapters:
+        num = l[4:-5 if closed else len(l)].split()[1]
+        if num[-1] == ":":
+          num = num[:-1]
+        numbers[0] = int(num)
+      else:
+        numbers[0] += 1
+    else:
+      if not numbers[level-2]:
+        warnings.append({"line": i, "kind": "nesting", "message": nesting_message(level, numbers)})
+      numbers[level-1] += 1
+    numbers[level:] = [0]*(5-level)
+    headings.append({"line": i, "level": level, "numbers": numbers[:level], "text": l, "closed": closed})
+  return Outline(n_lines, headings, warnings)
+
+#
+# the outline of an html file from its structural index (see OOindex.py):
+#   with use_cache, from the sidecar file if that was made from the file's
+#   contents as they are now (and with the same numbered_chapters), otherwise
+#   built from the lines the index says might be headings (and, with
+#   use_cache, saved in the sidecar)
+#
+def index_outline(index, numbered_chapters=False, use_cache=True):
+  if not use_cache:
+    return build_outline(((i, index.line(i)) for i in index.heading_lines()), len(index), numbered_chapters)
+  sidecar = index.fn+sidecar_suffix
+  key = "numbered" if numbered_chapters else "counted"
+  cached = {}
+  try:
+    with open(sidecar, 'r') as fh:
+      cached = json.load(fh)
+    if cached.get("sha256") != index.sha256 or cached.get("version") != outline_version:
+      cached = {}
+    elif key in cached.get("outlines", {}):
+      return from_dict(cached["outlines"][key])
+  except (OSError, ValueError, KeyError, TypeError, AttributeError):
+    cached = {}
+  outline = build_outline(((i, index.line(i)) for i in index.heading_lines()), len(index), numbered_chapters)
+  cached = {"sha256": index.sha256, "version": outline_version, "outlines": dict(cached.get("outlines", {}), **{key: outline.to_dict()})}
+  try:
+    with open(sidecar, 'w') as fh:
+      json.dump(cached, fh)
+  except OSError:
+    pass
+  return outline
+
+#
+# the outline of html file fn, from its structural index (writing the index,
+#   if it had to be built, with write_index)
+#
+def load_outline(fn, numbered_chapters=False, write_index=False, use_cache=True):
+  index = OOindex.load_index(fn, write_index)
+  try:
+    return index_outline(index, numbered_chapters, use_cache)
+  finally:
+    index.close()
+
+#
+# for OOoutliner's checking of all the files in a manifest, in a worker
+#   process: job is (filename, enclosing) and the result is (number of lines,
+#   warnings, error), the last being None if the file could be read
+#
+def check_section(job):
+  (fn, enclosing) = job
+  try:
+    with open(fn, 'r') as fh:
+      lines = fh.read().split("\n")
+  except (OSError, UnicodeDecodeError) as e:
+    return (0, [], str(e))
+  outline = build_outline(enumerate(lines), len(lines), enclosing=enclosing)
+  for w in outline.warnings:
+    w["text"] = lines[w["line"]].strip()
+  return (outline.n_lines, outline.warnings, None)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 Jonathan A. Poritz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# Renumbering the sections of a split book, for OOmake_room.py: given what
+#   each old section number X.Y becomes (possibly in another part, or
+#   nothing, if the section is being deleted), rewrites the manifest, the
+#   section filenames, the numbers at the start of headings and "Section X.Y"
+#   cross-references in the text, all at once, so that sections can be
+#   swapped or moved around in one run.  Not meant to be run by itself.
+#
+import os
+import re
+section_line_pat = re.compile(r'Chapter\[([1-9][0-9]*)\]: ([1-9][0-9]*)\.([0-9]+) (.*)')
+number_s = r'[1-9][0-9]*\.[0-9]+'
+#
+# one pattern for everything looked at in the text: a number X.Y (perhaps
+#   X.Y.Z...) at the start of a heading, a list of them after "Section" or
+#   "Sections", or any other X.Y, which is left alone but noted, since it
+#   might be a reference that should also have been changed
+#
+xref_list_s = number_s+r'(?:\.[0-9]+)*(?:(?:,? (?:and|or|to|&amp;) |, |-|–|&ndash;)'+number_s+r'(?:\.[0-9]+)*)*'
+renumber_pat = re.compile(r'(?P<heading><h[1-6][^>]*>)(?P<hnum>'+number_s+r')(?![0-9])'
+  r'|(?P<xref>(?:\bSections?|§)(?: |&nbsp;)?)(?P<xnums>'+xref_list_s+r')'
+  r'|(?<![0-9.])(?P<other>'+number_s+r')(?![0-9])')
+list_number_pat = re.compile(r'(?<![0-9.])('+number_s+r')(?![0-9])')
+
+#
+# the manifest's entries, as a list of [title line, filename] pairs (the
+#   filename being None for a "CSS: " line), skipping "#" lines
+#
+def read_manifest(fh):
+  mlines = [ml.strip() for ml in fh if ml.strip() and ml.strip()[0] != "#"]
+  entries = []
+  i = 0
+  while i < len(mlines):
+    mline = mlines[i]
+    i += 1
+    if mline[:5] == "CSS: ":
+      entries.append([mline, None])
+      continue
+    if mline[:4] not in ["FM: ", "BM: "] and mline[:6] != "Part: " and mline[:8] != "Chapter[":
+      raise ValueError(f"Malformed manifest file with line: {mline}")
+    if i >= len(mlines):
+      raise ValueError(f"Malformed manifest file: no filename after {mline}")
+    entries.append([mline, mlines[i]])
+    i += 1
+  return entries
+
+#
+# a renumbering file has lines "<old X.Y> <new X.Y>", or "<old X.Y> -" for a
+#   section which is to be deleted; blank lines and "#" lines are ignored
+#
+def read_renumbering(fh):
+  renumbering = {}
+  for (n, l) in enumerate(fh, 1):
+    l = l.strip()
+    if not l or l[0] == "#":
+      continue
+    words = l.split()
+    if len(words) != 2 or not re.fullmatch(number_s, words[0]) or not (words[1] == "-" or re.fullmatch(number_s, words[1])):
+      raise ValueError(f'Malformed renumbering on line {n}: "{l}" should be "X.Y X\'.Y\'" or "X.Y -"')
+    if words[0] in renumbering:
+      raise ValueError(f"Renumbering gives section {words[0]} more than once, on line {n}")
+    renumbering[words[0]] = None if words[1] == "-" else words[1]
+  return renumbering
+
+def split_number(num):
+  (x, y) = num.split(".")
+  return (int(x), int(y))
+
+#
+# what every section in the manifest becomes: from the renumbering where it
+#   is given there, otherwise shifted by shift within its part.  Only the
+#   sections whose numbers change are in the result
+#
+def section_mapping(entries, renumbering, shift=0):
+  parts = sum(1 for (mline, fn) in entries if mline[:6] == "Part: ")
+  old_numbers = []
+  for (mline, fn) in entries:
+    if mline[:8] != "Chapter[":
+      continue
+    m = section_line_pat.match(mline)
+    if not m:
+      raise ValueError(f"Malformed manifest file: section line {mline} doesn't start with a number X.Y")
+    if m.group(1) != m.group(2):
+      raise ValueError(f"Malformed manifest file: section name's implied part number doesn't match what manifest says it should be on {mline}")
+    old_numbers.append(m.group(2)+"."+m.group(3))
+  unknown = [num for num in renumbering if num not in old_numbers]
+  if unknown:
+    raise ValueError(f"Renumbering gives sections not in the manifest: {', '.join(unknown)}")
+  mapping = {}
+  new_numbers = {}
+  for num in old_numbers:
+    if num in renumbering:
+      new = renumbering[num]
+    else:
+      (x, y) = split_number(num)
+      new = f"{x}.{y+shift}"
+    if new is None:
+      mapping[num] = None
+      continue
+    if new in new_numbers:
+      raise ValueError(f"Sections {new_numbers[new]} and {num} would both become {new}")
+    new_numbers[new] = num
+    if parts and split_number(new)[0] > parts:
+      raise ValueError(f"Section {num} would become {new}, but there are only {parts} parts in the manifest")
+    if new != num:
+      mapping[num] = new
+  return mapping
+
+#
+# the manifest entries after renumbering, with the new filenames in output
+#   (a directory name ending in "/"), and a list of (old filename, new
+#   filename) of the files to rewrite; the sections are put in order of their
+#   new numbers, after everything else
+#
+def renumber_manifest(entries, mapping, output):
+  new_entries = []
+  sections = []
+  files = []
+  for (mline, fn) in entries:
+    if fn is None:
+      new_entries.append([mline, None])
+      continue
+    if mline[:8] != "Chapter[":
+      new_fn = output+os.path.basename(fn)
+      new_entries.append([mline, new_fn])
+      files.append((fn, new_fn))
+      continue
+    m = section_line_pat.match(mline)
+    num = m.group(2)+"."+m.group(3)
+    new = mapping.get(num, num)
+    if new is None:
+      continue
+    (x, y) = split_number(new)
+    new_fn = output+new+".html"
+    sections.append(((x, y), [f"Chapter[{x}]: {new} {m.group(4)}", new_fn]))
+    files.append((fn, new_fn))
+  new_entries += [entry for (xy, entry) in sorted(sections)]
+  new_fns = [new_fn for (fn, new_fn) in files]
+  for new_fn in new_fns:
+    if new_fns.count(new_fn) > 1:
+      raise ValueError(f"More than one file in the manifest would be written to {new_fn}")
+  return (new_entries, files)
+
+#
+# the text with its headings and cross-references renumbered, and a list of
+#   notes about what was changed and what might have needed to be
+#
+def renumber_text(text, mapping):
+  notes = []
+  def line_of(pos):
+    return text[text.rfind("\n", 0, pos)+1:text.find("\n", pos) if text.find("\n", pos) >= 0 else len(text)]
+  def renumber(m):
+    if m.group("heading"):
+      num = m.group("hnum")
+      if num in mapping:
+        if mapping[num] is None:
+          notes.append(f"heading for deleted section {num}: {line_of(m.start())}")
+          return m.group(0)
+        notes.append(f"heading {num} -> {mapping[num]}: {line_of(m.start())}")
+        return m.group("heading")+mapping[num]
+      return m.group(0)
+    if m.group("xref"):
+      def renumber_listed(lm):
+        num = lm.group(1)
+        if num in mapping:
+          if mapping[num] is None:
+            notes.append(f"reference to deleted section {num}: {line_of(m.start())}")
+            return num
+          return mapping[num]
+        return num
+      xnums = list_number_pat.sub(renumber_listed, m.group("xnums"))
+      if xnums != m.group("xnums"):
+        notes.append(f'reference "{m.group(0)}" -> "{m.group("xref")}{xnums}"')
+      return m.group("xref")+xnums
+    if m.group("other") in mapping:
+      notes.append(f"found other old X.Y match {m.group('other')}, left as it was, on line: {line_of(m.start())}")
+    return m.group(0)
+  return (renumber_pat.sub(renumber, text), notes)
+
+#
+# for a worker process: job is (old filename, new filename, mapping), and the
+#   result is the notes from renumber_text()
+#
+def renumber_file(job):
+  (fn, new_fn, mapping) = job
+  with open(fn, 'r') as fh:
+    text = fh.read()
+  (text, notes) = renumber_text(text, mapping)
+  with open(new_fn, 'w') as fh:
+    fh.write(text)
+  return notes
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 Jonathan A. Poritz
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# Choosing the HTML parser Beautiful Soup uses, shared by all the tools that
+#   make soups, and a much lighter way of getting at just the <a>s and <img>s
+#   in a bit of html.  Not meant to be run by itself.
+#
+import importlib.util
+from html.parser import HTMLParser
+from bs4 import BeautifulSoup
+#
+# the parsers Beautiful Soup can use, fastest first, with the module each
+#   one needs
+#
+parser_names = ['lxml', 'html.parser', 'html5lib']
+parser_modules = {'lxml': 'lxml', 'html.parser': 'html.parser', 'html5lib': 'html5lib'}
+
+def available_parsers():
+  return [p for p in parser_names if importlib.util.find_spec(parser_modules[p])]
+
+def default_parser():
+  return available_parsers()[0]
+
+def add_parser_argument(parser):
+  parser.add_argument("--parser", help=f'HTML parser for Beautiful Soup to use; default is the fastest one installed, here "{default_parser()}"', choices=parser_names, default=default_parser())
+
+def make_soup(markup, parser):
+  return BeautifulSoup(markup, parser)
+
+#
+# for tools which only want the attributes (and text) of the <a>s and <img>s
+#   in a line of html, something much lighter than a soup: a tokenizer pass
+#   which keeps just those tags, each looking enough like a soup's Tag for
+#   get(), get_text() and .string
+#
+void_tags = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source', 'track', 'wbr'}
+
+class LightTag:
+  def __init__(self, name, attrs):
+    self.name = name
+    self.attrs = {}
+    for (k, v) in attrs:
+      self.attrs.setdefault(k, v if v is not None else "")
+    self.children = []
+
+  def get(self, key, default=None):
+    return self.attrs.get(key, default)
+
+  def get_text(self):
+    return "".join(c if isinstance(c, str) else c.get_text() for c in self.children)
+
+  #
+  # as for a soup's Tag: the text, if that's all there is inside the tag,
+  #   perhaps inside one other tag, otherwise None
+  #
+  @property
+  def string(self):
+    if len(self.children) != 1:
+      return None
+    c = self.children[0]
+    return c if isinstance(c, str) else c.string
+
+class TagCollector(HTMLParser):
+  def __init__(self):
+    super().__init__(convert_charrefs=True)
+    self.a = []
+    self.img = []
+    self.open = []
+
+  def handle_starttag(self, name, attrs):
+    tag = LightTag(name, attrs)
+    if self.open:
+      self.open[-1].children.append(tag)
+    if name == 'img':
+      self.img.append(tag)
+    if name == 'a':
+      self.a.append(tag)
+      self.open.append(tag)
+    elif self.open and name not in void_tags:
+      self.open.append(tag)
+
+  def handle_startendtag(self, name, attrs):
+    self.handle_starttag(name, attrs)
+    if self.open and self.open[-1].name == name and name not in void_tags:
+      self.open.pop()
+
+  def handle_endtag(self, name):
+    for i in range(len(self.open)-1, -1, -1):
+      if self.open[i].name == name:
+        del self.open[i:]
+        break
+
+  def handle_data(self, data):
+    if self.open:
+      self.open[-1].children.append(data)
+
+#
+# the <a>s and the <img>s in markup, as lists of LightTags
+#
+def tags_of(markup):
+  collector = TagCollector()
+  collector.feed(markup)
+  collector.close()
+  return (collector.a, collector.img)
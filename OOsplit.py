@@ -14,6 +14,9 @@
 #
 import argparse
 import fileinput
+import hashlib
+import io
+import mmap
 import os
 import re
 import code
@@ -36,6 +39,7 @@ parser.add_argument("-m", "--manifest", help="Name to use as manifest file for l
 parser.add_argument("-p", "--preamble", help="Name manifest preamble file. If absent, there will be no preamble", default="")
 parser.add_argument("-o", "--output", help="Name to use as output directory. If absent, will be OOhtml", default="OOhtml")
 parser.add_argument("-k","--key_terms_strong", help='manually makes the terms in the Key Terms section strong, i.e., any line of the form "<li><term>: <other text>" in the Key Terms section becomes "<li><strong><term></strong>: <other text>"; default is False', action='store_true')
+parser.add_argument("-u","--update", help='write into an existing output directory, only touching the files whose content has changed, and print the manifest lines of the changed sections on the console, ready to be given to OOreup.py (so don\'t use with -v if piping them there); default is False', action='store_true')
 parser.add_argument("-n","--numbered_sections", help='asserts that the sections and subsections at all levels have been pre-numbered -- however, they will be newly numbered and discrepancies will be reported; default is False', action='store_true')
 args = parser.parse_args()
 output = args.output
@@ -77,9 +81,78 @@ with open(temp_fn, 'r') as img_fh:
 
 os.remove(temp_fn)
 
+#
+# the PB src of every <img> in the image file, in order, with where each one
+#   ends in the file (for the error messages), so each <img> in the book just
+#   takes the next one
+#
+img_src_pat = re.compile(r'<img.*?src=.([^"]*)"', re.DOTALL)
+line_src_pat = re.compile(r'(<img.*?src=.)[^"]*')
+pb_srcs = [(m.group(1), m.end(1)) for m in img_src_pat.finditer(img_file_s)]
+img_no=0
 img_x=0
-os.mkdir(output)
-log_and_print(f'Made directory {output}')
+def pb_src(m):
+  global img_no, img_x
+  if img_no >= len(pb_srcs):
+    raise ValueError("not enough img tags in "+imgfile+" for line #"+str(line_no)+":\n"+line+"\nremainder of image file is:\n"+img_file_s[img_x:])
+  (src, img_x) = pb_srcs[img_no]
+  img_no += 1
+  return m.group(1)+src
+#
+# the files are each built in memory and only written out when done; with
+#   --update, only if they differ from what is already there (the manifest's
+#   "#" lines, which record when it was made, don't count).  The first
+#   "1.0.html", for anything before the first <h1>, is usually replaced by
+#   the one for chapter 1, so it is only written at the end if it wasn't
+#
+disk_hashes = {}
+written_hashes = {}
+def content_hash(text, skip_comments):
+  if skip_comments:
+    text = b"".join(l for l in text.splitlines(True) if l[:1] != b"#")
+  return hashlib.sha256(text).hexdigest()
+
+def write_if_changed(fn, text, skip_comments=False):
+  h = content_hash(text, skip_comments)
+  if fn not in disk_hashes:
+    disk_hashes[fn] = None
+    if args.update and os.path.exists(fn):
+      with open(fn,'rb') as old_fh:
+        disk_hashes[fn] = content_hash(old_fh.read(), skip_comments)
+    written_hashes[fn] = disk_hashes[fn]
+  if h != written_hashes[fn]:
+    with open(fn,'wb') as out_fh:
+      out_fh.write(text)
+    written_hashes[fn] = h
+
+#
+# they are kept as bytes, since most of what goes in them is copied straight
+#   from the book without being decoded
+#
+deferred_files = {}
+class OutputFile(io.BytesIO):
+  def __init__(self, fn, skip_comments=False, deferred=False):
+    super().__init__()
+    self.fn = fn
+    self.skip_comments = skip_comments
+    self.deferred = deferred
+  def write(self, s):
+    return super().write(s.encode() if isinstance(s, str) else s)
+  def close(self):
+    if not self.closed:
+      if self.deferred:
+        deferred_files[self.fn] = self.getvalue()
+      else:
+        write_if_changed(self.fn, self.getvalue(), self.skip_comments)
+    super().close()
+
+if args.update and os.path.isdir(output):
+  old_html_files = set(f for f in os.listdir(output) if f.endswith(".html"))
+  log_and_print(f'Updating directory {output}')
+else:
+  old_html_files = set()
+  os.mkdir(output)
+  log_and_print(f'Made directory {output}')
 h2pat = re.compile(r'<h2>([1-9]+[0-9]*)\.([0-9]*) (.*)</h2>\n') 
 h3pat = re.compile(r'<h3>([1-9]+[0-9]*)\.([0-9]*)\.([0-9]*) (.*)</h3>\n') 
 h4pat = re.compile(r'<h4>([1-9]+[0-9]*)\.([0-9]*)\.([0-9]*)\.([0-9]*) (.*)</h4>\n')
@@ -87,7 +160,7 @@ h5pat = re.compile(r'<h5>([1-9]+[0-9]*)\.([0-9]*)\.([0-9]*)\.([0-9]*)\.([0-9]*)
 preamble_lines = 0
 manifest_chapter_lines = 0
 manifest_part_lines = 0
-manifest_fh = open(output+"/"+args.manifest,'w')
+manifest_fh = OutputFile(output+"/"+args.manifest, skip_comments=True)
 manifest_fh.write("# "+when_work+", this was\n")
 manifest_fh.write("# "+what_work+" which resulted in this file\n")
 if preamble:
@@ -100,7 +173,7 @@ if preamble:
     manifest_fh.write("\n")
   log_and_print(f'Wrote {preamble_lines} manifest preamble lines')
 current_filename=output+"/"+"1"+".0.html"
-current_fh = open(current_filename,"w")
+current_fh = OutputFile(current_filename, deferred=True)
 new_html_files = 0
 total_html_lines = 0
 KT_pattern=re.compile('<li>([^:]+):')
@@ -115,23 +188,55 @@ learn_obj_header = "<div class=\"textbox textbox--learning-objectives\"><header
 # current_fh.write('<div class="textbox__content">\n')
 # total_html_lines += 4
 
-while True:
-  line = args.input_file.readline().decode()
-  if not line:
-    break
+#
+# the book is memory-mapped and one scan of its bytes finds the lines which
+#   might need something done to them: headings, and lines with <img>s.  Only
+#   those are decoded; everything between them goes into the section files as
+#   it is.  (A line with, say, "<h3" not at its start is decoded for nothing,
+#   but comes out the same, and it's a much quicker scan than one anchored
+#   at line starts.)
+#
+special_pat = re.compile(rb'<(?:h1|h[235]|img)')
+if os.fstat(args.input_file.fileno()).st_size:
+  book = mmap.mmap(args.input_file.fileno(), 0, access=mmap.ACCESS_READ)
+else:
+  book = b""
+book_pos = 0
+def next_book_line():
+  global book_pos
+  start = book_pos
+  end = book.find(b"\n", start)
+  book_pos = len(book) if end < 0 else end+1
+  return book[start:book_pos].decode()
+
+def copy_book_lines(end):
+  global book_pos, line_no, total_html_lines
+  lines = book[book_pos:end]
+  if lines:
+    current_fh.write(lines)
+    n = lines.count(b"\n")+(lines[-1:] != b"\n")
+    line_no += n
+    total_html_lines += n
+  book_pos = end
+
+for m in special_pat.finditer(book):
+  if m.start() < book_pos:
+    continue
+  copy_book_lines(book.rfind(b"\n", book_pos, m.start())+1 or book_pos)
+  line = next_book_line()
   line_no += 1
   if "<h1" in line:
-    close = args.input_file.readline().decode()
-    close = args.input_file.readline().decode()
+    close = next_book_line()
+    close = next_book_line()
     if "</h1>" not in close:
       raise ValueError("malformed line with h1 tag: "+line+" on line "+str(line_no))
     current_fh.write("</div>\n")
     total_html_lines += 1
     if current_fh:
       current_fh.close()
-    next_pos = args.input_file.tell()
-    next_line = args.input_file.readline().decode()
-    args.input_file.seek(next_pos)
+    next_pos = book_pos
+    next_line = next_book_line()
+    book_pos = next_pos
     chap_no=next_line[next_line.find(">")+1:next_line.find("</")]
     sect_no=0
     sect_title = ''
@@ -139,7 +244,7 @@ while True:
     sub_sub_sect_no=0
     sub_sub_sub_sect_no=0
     current_filename=output+"/"+chap_no+".0.html"
-    current_fh = open(current_filename,"w")
+    current_fh = OutputFile(current_filename)
     new_html_files += 1
     current_fh.write("Click on the <strong>+</strong> in the <strong>Contents</strong> menu to see all the parts of this chapter, or go through them in order by clicking <strong>Next →</strong> below.\n")
     total_html_lines += 1
@@ -165,7 +270,7 @@ while True:
     if current_fh:
       current_fh.close()
     current_filename = output+"/"+chap_no+"."+str(sect_no)+".html"
-    current_fh = open(current_filename,"w")
+    current_fh = OutputFile(current_filename)
     new_html_files += 1
     manifest_chapter_lines += 1
     manifest_chapters += "Chapter["+chap_no+"]: "+chap_no+"."+str(sect_no)+" "+sect_title+"\n"+current_filename+"\n"
@@ -207,32 +312,47 @@ while True:
     total_html_lines += 1
   else:
 # the stuff below doesn't handle nested tables very well...
-    x=0
-    while "<img" in line[x:]:
-      y0=x+line[x:].find("<img")+4
-      y=y0+line[y0:].find("src=")+5
-      current_fh.write(line[x:y])
-      if not "<img" in img_file_s[img_x:]:
-        raise ValueError("not enough img tags in "+imgfile+" for line #"+str(line_no)+":\n"+line+"\nremainder of image file is:\n"+img_file_s[img_x:])
-      img_y0=img_x+img_file_s[img_x:].find("<img")+4
-      img_y=img_y0+img_file_s[img_y0:].find("src=")+5
-      img_y1=img_y+img_file_s[img_y:].find('"')
-      current_fh.write(img_file_s[img_y:img_y1])
-      img_x=img_y1
-      x=y+line[y:].find('"')
-    current_fh.write(line[x:])
+    current_fh.write(line_src_pat.sub(pb_src, line) if "<img" in line else line)
     total_html_lines += 1
+copy_book_lines(len(book))
+if book:
+  book.close()
 
-if "<img" in img_file_s[img_x:]:
-  raise ValueError(f"{img_file_s[img_x:].count('<img') } too many img tags in {imgfile}")
+if img_file_s.count('<img', img_x):
+  raise ValueError(f"{img_file_s.count('<img', img_x) } too many img tags in {imgfile}")
 if current_fh:
   current_fh.close()
   new_html_files += 1
+for fn in deferred_files:
+  if fn not in written_hashes:
+    write_if_changed(fn, deferred_files[fn])
 log_and_print(f'Wrote {manifest_part_lines} manifest part lines')
 manifest_fh.write(manifest_chapters)
 log_and_print(f'Wrote {manifest_chapter_lines} manifest chapter lines')
+manifest_text = manifest_fh.getvalue().decode()
 manifest_fh.close()
 log_and_print(f'Created {new_html_files} new html files in {output}')
+if args.update:
+  changed = set(fn for fn in written_hashes if written_hashes[fn] != disk_hashes[fn])
+  log_and_print(f'{len(changed)} of the {len(written_hashes)} files in {output} changed')
+  stale = sorted(old_html_files-set(os.path.basename(fn) for fn in written_hashes))
+  if stale:
+    log_and_print(f'Files in {output} no longer made from {args.input_file.name}, left as they were: {", ".join(stale)}')
+  #
+  # the manifest entries (title line then filename line) of the changed
+  #   sections, in manifest order, for OOreup.py
+  #
+  entries = [l for l in manifest_text.split("\n") if l and l[0] != "#"]
+  print("# "+when_work+", these were the sections changed by")
+  print("# "+what_work)
+  i = 0
+  while i < len(entries):
+    if entries[i][:5] == "CSS: ":
+      i += 1
+      continue
+    if i+1 < len(entries) and entries[i+1].strip() in changed:
+      print(entries[i]+"\n"+entries[i+1])
+    i += 2
 log_and_print("Done (on "+time.strftime('%d/%m/%Y')+")!")
 logfile_fh.write("------------------------------------\n")
 logfile_fh.close()
\ No newline at end of file